@@ -0,0 +1,185 @@
+import uuid
+from typing import Any, Dict
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from pydantic import BaseModel
+from request_session import RequestSession, SessionFlushRoute, get_api_session
+from llm_scheduler import LLMRateLimited
+from interview_controller import (
+    setup_interview,
+    generate_question,
+    submit_answer,
+    continue_interview,
+    end_interview,
+    delete_interview_session
+)
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Versioned JSON API for single-page and mobile clients. Every call returns
+# the state the client needs next, so an interview turn is one request:
+# POST /answer evaluates the answer and already moves on to the next
+# (usually prefetched) question, instead of the browser's
+# POST -> 303 -> GET chains that reload the session and render a page per hop.
+#
+# Authenticate with the session cookie or "Authorization: Bearer <token>",
+# where the token is returned by POST /api/v1/sessions.
+
+router = APIRouter(prefix="/api/v1", route_class=SessionFlushRoute)
+
+RATE_LIMITED_DETAIL = "The AI service is rate limiting this API key. Please retry shortly."
+
+class SessionCreate(BaseModel):
+    api_key: str
+
+class InterviewCreate(BaseModel):
+    job_topic: str
+    questions_per_round: int = 5
+    use_voice: bool = False
+
+class AnswerCreate(BaseModel):
+    answer: str
+    # The question being answered. Required, so a retry after the interview
+    # already moved on is rejected instead of answering the next question
+    question: str
+    # Move on to the next question in the same call
+    advance: bool = True
+
+def interview_state(session: RequestSession) -> Dict[str, Any]:
+    """What a client needs to render the current step"""
+    return {
+        "job_topic": session.get("job_topic"),
+        "question_number": session.get("question_number"),
+        "questions_per_round": session.get("questions_per_round"),
+        "question": session.get("current_question"),
+        "answer": session.get("current_answer"),
+        "feedback": session.get("feedback"),
+        "interview_complete": bool(session.get("interview_complete")),
+    }
+
+async def _ensure_question(session: RequestSession) -> None:
+    if session.get("current_question"):
+        return
+    # generate_question logs its own failures and returns None
+    try:
+        question = await generate_question(session)
+    except LLMRateLimited:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=RATE_LIMITED_DETAIL)
+    if not question:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Could not generate question")
+
+@router.post("/sessions", status_code=status.HTTP_201_CREATED)
+async def create_session(data: SessionCreate, response: Response):
+    """Start a session for an OpenAI API key and return its token"""
+    session_id = str(uuid.uuid4())
+    session = RequestSession(session_id)
+    session.update(api_key=data.api_key, initialized=True)
+    if not await session.flush():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Failed to create session")
+
+    # Browsers can rely on the cookie, other clients send the token
+    response.set_cookie(key="session_id", value=session_id, httponly=True, secure=True, samesite="lax")
+    return {"token": session_id}
+
+@router.delete("/sessions/current", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_current_session(response: Response, session: RequestSession = Depends(get_api_session)):
+    await delete_interview_session(session.session_id)
+    response.delete_cookie(key="session_id")
+
+@router.post("/interview")
+async def start_interview(data: InterviewCreate, session: RequestSession = Depends(get_api_session)):
+    """Set up an interview and return its first question"""
+    if data.questions_per_round < 1:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="questions_per_round must be at least 1")
+
+    try:
+        await setup_interview(session, data.job_topic, data.questions_per_round, data.use_voice)
+        await _ensure_question(session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in start_interview: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to start interview")
+    return interview_state(session)
+
+@router.get("/interview")
+async def get_interview(session: RequestSession = Depends(get_api_session)):
+    """Current step of the interview, generating the question if there is none yet"""
+    if not session.get("job_topic"):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="No interview has been set up")
+
+    if not session.get("interview_complete"):
+        await _ensure_question(session)
+    return interview_state(session)
+
+@router.post("/interview/answer")
+async def answer_question(data: AnswerCreate, session: RequestSession = Depends(get_api_session)):
+    """Evaluate an answer and, unless ``advance`` is false, move to the next question
+
+    The response holds the feedback, the answered question and the new state.
+    If moving on fails, the feedback is still returned, with ``question`` null
+    and the reason in ``next_error``; ``GET /interview`` then retries.
+    """
+    answered = session.get("current_question")
+    if not answered:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="There is no question to answer")
+    if data.question != answered:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="That question is no longer current")
+
+    round_complete = session.get("question_number", 1) >= session.get("questions_per_round", 0)
+    try:
+        feedback = await submit_answer(session, data.answer)
+    except LLMRateLimited:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=RATE_LIMITED_DETAIL)
+    except Exception as e:
+        logger.exception("Error in answer_question: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to evaluate answer")
+    if not feedback:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Could not generate feedback")
+
+    # Save the evaluated answer now, so a failure while moving on cannot
+    # throw away feedback that was already paid for
+    if not await session.flush():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Failed to save the answer")
+
+    next_error = None
+    if data.advance:
+        try:
+            await continue_interview(session)
+            await _ensure_question(session)
+        except HTTPException as e:
+            next_error = e.detail
+        except Exception as e:
+            logger.exception("Error moving to the next question: %s", e)
+            next_error = "Failed to load the next question"
+
+    # The state's own feedback belongs to the next question, hence last here
+    return {
+        **interview_state(session),
+        "answered_question": answered,
+        "feedback": feedback,
+        "round_complete": round_complete,
+        "next_error": next_error,
+    }
+
+@router.post("/interview/next")
+async def next_question(session: RequestSession = Depends(get_api_session)):
+    """Move on after an answer submitted with ``advance`` set to false"""
+    await continue_interview(session)
+    await _ensure_question(session)
+    return interview_state(session)
+
+@router.post("/interview/end")
+async def finish_interview(session: RequestSession = Depends(get_api_session)):
+    await end_interview(session)
+    return await get_summary(session)
+
+@router.get("/interview/summary")
+async def get_summary(session: RequestSession = Depends(get_api_session)):
+    """Every completed question with its answer and feedback"""
+    await session.load_history("completed_questions")
+    return {
+        "job_topic": session.get("job_topic"),
+        "completed_questions": session["completed_questions"],
+        "interview_complete": bool(session.get("interview_complete")),
+    }
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import random
+import sys
+from typing import Any
+
+# Structured, leveled logging for the web app. Records are emitted as one JSON
+# object per line (Log_Format=text for human-readable output), sensitive
+# fields are redacted, and debug records can be sampled. Debug dumps are off
+# by default: pass payloads as ``Redacted(value)`` arguments so they are only
+# serialized when a handler actually emits the record.
+
+LOG_LEVEL = os.getenv("Log_Level", "INFO").upper()
+LOG_FORMAT = os.getenv("Log_Format", "json").lower()
+# Fraction of DEBUG records to keep when debug logging is enabled
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("Log_Debug_Sample_Rate", "1.0"))
+
+SENSITIVE_FIELDS = frozenset({"api_key", "password", "token", "authorization"})
+MAX_STRING_LENGTH = 80
+MAX_LIST_ITEMS = 5
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def redact(value: Any, depth: int = 0) -> Any:
+    """Copy of value with secrets masked and long strings and lists shortened"""
+    if depth > 4:
+        return "..."
+    if isinstance(value, dict):
+        return {
+            key: "***" if str(key).lower() in SENSITIVE_FIELDS else redact(item, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        if len(value) > MAX_LIST_ITEMS:
+            return f"[{len(value)} items]"
+        return [redact(item, depth + 1) for item in value]
+    if isinstance(value, str) and len(value) > MAX_STRING_LENGTH:
+        return f"{value[:MAX_STRING_LENGTH]}... ({len(value)} chars)"
+    return value
+
+class Redacted:
+    """Log argument that is redacted and serialized only if the record is emitted"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        return json.dumps(redact(self.value), default=str)
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = "***" if key.lower() in SENSITIVE_FIELDS else redact(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DebugSamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records, never dropping anything above"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+_root = logging.getLogger("interviewmate")
+
+def configure_logging() -> None:
+    """Attach the handler to the app's root logger once"""
+    if _root.handlers:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "text":
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+    if LOG_DEBUG_SAMPLE_RATE < 1.0:
+        handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+    _root.addHandler(handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for one module, e.g. get_logger("redis_session_manager")"""
+    configure_logging()
+    return _root.getChild(name)
@@ -0,0 +1,75 @@
+"""Cold-start benchmark for building the interviewer
+
+Times the construction of the headless InterviewMate used by the web app
+against VoiceEnabledInterviewMate, both as it is now (voice engines loaded on
+first use) and with the voice stack brought up the way its constructor used
+to: pyttsx3.init(), a speech Recognizer and an opened Microphone. Each sample
+runs in a fresh interpreter, the way a serverless cold start does; imports
+happen before the clock starts and are reported separately.
+
+    python benchmarks/cold_start.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONSTRUCTION = {
+    # What the web app builds per API key
+    "InterviewMate (web app)": 'InterviewMate("sk-bench")',
+    # The desktop interviewer before any voice feature is used
+    "VoiceEnabledInterviewMate (lazy voice stack)": 'VoiceEnabledInterviewMate("sk-bench")',
+    # What VoiceEnabledInterviewMate.__init__ used to do on every construction
+    "VoiceEnabledInterviewMate + voice stack (previous)": (
+        'mate = VoiceEnabledInterviewMate("sk-bench"); mate.engine; mate.recognizer; mate.microphone'
+    ),
+}
+
+IMPORTS = {
+    "import chatbot": "import chatbot",
+    "import chatbot + voice engines": "import chatbot, pyttsx3, speech_recognition",
+}
+
+CHILD = """
+import time
+start = time.perf_counter()
+{setup}
+ready = time.perf_counter()
+{statement}
+print(time.perf_counter() - ready, ready - start)
+"""
+
+def run_child(setup: str, statement: str) -> float:
+    """Seconds the statement took in a fresh interpreter, after setup"""
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD.format(setup=setup, statement=statement)],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    )
+    return float(result.stdout.split()[0])
+
+def report(name: str, setup: str, statement: str, runs: int) -> None:
+    try:
+        samples = [run_child(setup, statement) for _ in range(runs)]
+    except subprocess.CalledProcessError:
+        print(f"  {name}: skipped, unavailable in this environment (no voice engines or audio device?)")
+        return
+    print(f"  {name}: {statistics.median(samples) * 1000:.1f} ms median over {runs} runs")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print("Construction (imports done beforehand):")
+    for name, statement in CONSTRUCTION.items():
+        report(name, "from chatbot import InterviewMate, VoiceEnabledInterviewMate", statement, args.runs)
+
+    print("Imports:")
+    for name, statement in IMPORTS.items():
+        report(name, "", statement, args.runs)
+
+if __name__ == "__main__":
+    main()
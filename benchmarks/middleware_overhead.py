@@ -0,0 +1,87 @@
+"""Throughput of the HTML routes with the old and new error middleware
+
+Serves requests in-process through httpx's ASGI transport, so the numbers
+measure the app and its middleware stack only - no sockets, no Redis (the
+routes are hit without a session cookie) and no LLM calls.
+
+    python benchmarks/middleware_overhead.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # templates/ and static/ are resolved relative to the cwd
+
+import httpx
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+import main as web
+
+# Pages that render a template or redirect without needing a session
+ROUTES = ["/", "/setup", "/interview", "/summary"]
+
+class BaseHTTPErrorLoggingMiddleware(BaseHTTPMiddleware):
+    """The previous ErrorLoggingMiddleware, kept here for comparison"""
+
+    async def dispatch(self, request, call_next):
+        try:
+            return await call_next(request)
+        except Exception:
+            web.logger.exception("Error in request %s %s", request.method, request.url.path)
+            return web.templates.TemplateResponse(
+                "error.html",
+                {"request": request, "error": "An internal server error occurred. Please try again."},
+                status_code=500
+            )
+
+def use_error_middleware(cls) -> None:
+    """Swap the error middleware in web.app and rebuild its middleware stack"""
+    for position, middleware in enumerate(web.app.user_middleware):
+        if middleware.cls in (web.ErrorLoggingMiddleware, BaseHTTPErrorLoggingMiddleware):
+            web.app.user_middleware[position] = Middleware(cls)
+    web.app.middleware_stack = None
+
+async def run(total: int, concurrency: int) -> float:
+    """Requests per second over ``total`` requests spread across the routes"""
+    transport = httpx.ASGITransport(app=web.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # Warm up template compilation and the middleware stack
+        for route in ROUTES:
+            await client.get(route)
+
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(ROUTES[i % len(ROUTES)])
+
+        async def worker():
+            while not queue.empty():
+                response = await client.get(queue.get_nowait())
+                assert response.status_code < 500, response.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    scenarios = {
+        "BaseHTTPMiddleware (previous)": BaseHTTPErrorLoggingMiddleware,
+        "pure ASGI middleware": web.ErrorLoggingMiddleware,
+    }
+    for name, cls in scenarios.items():
+        use_error_middleware(cls)
+        # Best of several rounds to smooth out scheduler noise
+        best = max(asyncio.run(run(args.requests, args.concurrency)) for _ in range(args.rounds))
+        print(f"{name}: {best:,.0f} req/s ({args.requests} requests, concurrency {args.concurrency})")
+
+if __name__ == "__main__":
+    main()
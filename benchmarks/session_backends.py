@@ -0,0 +1,104 @@
+"""Load test of the session backends: per-request session latency
+
+Simulates concurrent users going through interview turns. Each request
+loads the hot session and writes back what a page handler typically
+changes, the way RequestSession does. The session part of every request is
+timed. The redis and tiered backends use the Redis settings from the
+environment and are skipped when Redis is unreachable.
+
+    python benchmarks/session_backends.py --users 50 --turns 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import session_manager
+from redis_session_manager import close_redis_client, get_redis_client
+
+FEEDBACK = "**Strengths:** Clear structure and a concrete example. " * 20
+
+async def user_session(backend, turns: int, latencies: list) -> None:
+    """One user's interview; every awaited session call counts as request time"""
+    session_id = str(uuid.uuid4())
+    await backend.update_session(session_id, api_key="sk-benchmark", job_topic="Backend Engineer",
+                                 question_number=1, previous_questions=[], completed_questions=[],
+                                 question_queue=[])
+
+    for turn in range(turns):
+        question = f"Question {turn}: how would you design a rate limiter?"
+
+        # GET /interview
+        start = time.perf_counter()
+        await backend.get_session(session_id, history=False)
+        await backend.update_session(session_id, current_question=question, current_answer=None, feedback=None)
+        latencies.append(time.perf_counter() - start)
+
+        # POST /submit-answer and the streamed feedback
+        start = time.perf_counter()
+        await backend.get_session(session_id, history=False)
+        await backend.update_session(
+            session_id, current_answer="An answer", feedback=FEEDBACK,
+            appends={"completed_questions": [{"question": question, "answer": "An answer", "feedback": FEEDBACK}]}
+        )
+        latencies.append(time.perf_counter() - start)
+
+        # POST /continue
+        start = time.perf_counter()
+        await backend.get_session(session_id, history=False)
+        await backend.get_session_history(session_id, ["previous_questions"])
+        await backend.update_session(session_id, question_number=turn + 2, current_question=None,
+                                     appends={"previous_questions": [question]})
+        latencies.append(time.perf_counter() - start)
+
+    # GET /summary
+    start = time.perf_counter()
+    await backend.get_session(session_id, history=False)
+    await backend.get_session_history(session_id, ["completed_questions"])
+    latencies.append(time.perf_counter() - start)
+
+    await backend.delete_session(session_id)
+
+async def redis_available() -> bool:
+    try:
+        await asyncio.wait_for(get_redis_client().ping(), timeout=5)
+        return True
+    except Exception:
+        return False
+
+async def run(name: str, users: int, turns: int) -> None:
+    if name != "memory" and not await redis_available():
+        print(f"{name:7} skipped, Redis is not reachable with the configured settings")
+        return
+
+    backend = session_manager.create_backend(name)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(user_session(backend, turns, latencies) for _ in range(users)))
+    elapsed = time.perf_counter() - start
+    await backend.close()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{name:7} p50 {quantiles[49] * 1000:7.2f} ms  p95 {quantiles[94] * 1000:7.2f} ms  "
+          f"p99 {quantiles[98] * 1000:7.2f} ms  ({len(latencies) / elapsed:,.0f} requests/s)")
+
+async def main_async(args) -> None:
+    for name in args.backends:
+        await run(name, args.users, args.turns)
+    await close_redis_client()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", default=["memory", "redis", "tiered"])
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Session codec micro-benchmark: encode/decode time and stored bytes
+
+Builds realistic sessions with 5, 20 and 50 completed questions, each with
+an answer and multi-paragraph feedback, and encodes them the way Redis
+stores them: one value per scalar field and one per list item. Codecs whose
+optional packages are missing here are skipped.
+
+    python benchmarks/session_codec.py --runs 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from session_codec import SessionCodec
+
+SESSION_SIZES = (5, 20, 50)
+
+class StdlibJsonCodec:
+    """What the session manager did before: json.dumps / json.loads per value"""
+
+    encode = staticmethod(json.dumps)
+    decode = staticmethod(json.loads)
+
+CODECS = {
+    "json module (previous)": None,
+    "json, uncompressed": ("json", "none"),
+    "json + zlib": ("json", "zlib"),
+    "json + zstd": ("json", "zstd"),
+    "msgpack + zlib": ("msgpack", "zlib"),
+    "msgpack + zstd": ("msgpack", "zstd"),
+}
+
+WORDS = ("the candidate explained how they would design scale cache database index "
+         "latency tradeoff consistency queue retry monitoring testing deployment rollback "
+         "strong clear answer could improve example structure depth concrete metrics").split()
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def _feedback(rng: random.Random) -> str:
+    sections = ["Strengths", "Areas for improvement", "Suggested answer", "Score"]
+    return "\n\n".join(f"**{section}:** " + " ".join(_text(rng, 18) for _ in range(3)) for section in sections)
+
+def build_session(completed: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    questions = [_text(rng, 16).rstrip(".") + "?" for _ in range(completed + 3)]
+    return {
+        "session_id": "6f1c2d9e-3b7a-4c55-9a0e-1d2f3a4b5c6d",
+        "api_key": "sk-" + "x" * 48,
+        "job_topic": "Backend Engineer",
+        "questions_per_round": 5,
+        "use_voice": False,
+        "question_number": completed + 1,
+        "bank_offset": 123456,
+        "bank_cursor": completed,
+        "current_question": questions[completed],
+        "current_answer": _text(rng, 60),
+        "feedback": _feedback(rng),
+        "previous_questions": questions[:completed],
+        "completed_questions": [
+            {"question": questions[i], "answer": _text(rng, 60), "feedback": _feedback(rng)}
+            for i in range(completed)
+        ],
+        "question_queue": [{"question": q, "job_topic": "Backend Engineer"} for q in questions[completed + 1:]],
+    }
+
+def stored_values(session: dict) -> list:
+    """The values written to Redis for one session in the hash layout"""
+    values = []
+    for value in session.values():
+        values.extend(value if isinstance(value, list) else [value])
+    return values
+
+def measure(codec, values: list, runs: int):
+    encoded = [codec.encode(value) for value in values]
+    start = time.perf_counter()
+    for _ in range(runs):
+        encoded = [codec.encode(value) for value in values]
+    encode_time = (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        decoded = [codec.decode(data) for data in encoded]
+    decode_time = (time.perf_counter() - start) / runs
+
+    assert decoded == values
+    return encode_time, decode_time, sum(len(data) for data in encoded)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--threshold", type=int, default=1024)
+    args = parser.parse_args()
+
+    for size in SESSION_SIZES:
+        session = build_session(size)
+        values = stored_values(session)
+        blob = len(json.dumps(session))
+        print(f"\n{size} completed questions (legacy single JSON blob: {blob:,} bytes)")
+        for name, config in CODECS.items():
+            codec = StdlibJsonCodec() if config is None else SessionCodec(*config, threshold=args.threshold)
+            try:
+                encode_time, decode_time, stored = measure(codec, values, args.runs)
+            except ImportError as e:
+                print(f"  {name:32} skipped ({e.name} not installed)")
+                continue
+            print(f"  {name:32} encode {encode_time * 1e6:8.1f} us  decode {decode_time * 1e6:8.1f} us  "
+                  f"stored {stored:9,} bytes ({stored / blob:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 import os
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langchain_openai import ChatOpenAI
-import pyttsx3  
-import speech_recognition as sr
+import httpx
+import hashlib
+from question_similarity import QuestionIndex, covered_subtopics
+from llm_usage import TokenUsageCallback, estimate_tokens
+from llm_scheduler import scheduler
 
 question_template = """
 You are an AI interview assistant named "InterviewMate". You are an expert interviewer for all professional fields.
@@ -19,14 +22,36 @@ Make sure the question is:
 - Challenging but answerable
 - Clear and concise
 
-Previous questions asked in this session:
+Most recent questions already asked in this session:
 {previous_questions}
 
-IMPORTANT: Do NOT repeat any of the previous questions. Generate a completely new and different question.
+IMPORTANT: Do NOT repeat or rephrase any of the previous questions. Generate a completely new and different question.
 
 Return ONLY the interview question without any introductory text or explanations.
 """
 
+batch_question_template = """
+You are an AI interview assistant named "InterviewMate". You are an expert interviewer for all professional fields.
+
+The user wants to practice for an interview in the field of: {job_topic}
+
+Generate {count} challenging and realistic interview questions about {job_topic}. They will be questions #{question_number} onwards in the practice session.
+
+Make sure each question is:
+- Technical and specific to the job topic
+- Similar to what might be asked in a real interview
+- Challenging but answerable
+- Clear and concise
+- Different from every other question in the list
+
+Most recent questions already asked in this session:
+{previous_questions}
+
+IMPORTANT: Do NOT repeat or rephrase any of the previous questions.
+
+Return ONLY a JSON array of {count} strings, one interview question per string, without any introductory text or explanations.
+"""
+
 feedback_template = """
 You are an AI interview assistant named "InterviewMate". You are an expert interviewer for all professional fields.
 
@@ -45,19 +70,62 @@ Provide detailed feedback on the candidate's answer. Include:
 Be specific, constructive, and helpful. Your goal is to help the candidate improve their interview skills.
 """
 
-class VoiceEnabledInterviewMate:
-    def __init__(self, api_key=None):
-        # Initialize text-to-speech engine
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', 150)
-        self.engine.setProperty('volume', 0.9)
-        voices = self.engine.getProperty('voices')
-        self.engine.setProperty('voice', voices[1].id)  # Female voice
+# Only this many recent questions are quoted in the prompt; older repeats are
+# caught by the local similarity filter instead
+PROMPT_QUESTION_DIGEST_SIZE = int(os.getenv("Prompt_Question_Digest_Size", "8"))
+PROMPT_QUESTION_MAX_WORDS = 20
+# Upper bound on the tokens spent describing earlier questions in a prompt
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("Prompt_Context_Token_Budget", "300"))
+
+def question_digest(previous_questions, token_budget=None):
+    """Bounded summary of earlier questions for the prompt
+
+    The most recent questions are quoted (newest kept first when the budget is
+    tight) and everything older is folded into a short list of covered
+    subtopics, so the result stays under the token budget however long the
+    session runs.
+    """
+    if not previous_questions:
+        return "None yet."
+    budget = PROMPT_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+
+    # Leave room for the subtopic summary when some questions will not be quoted
+    recent_budget = budget * 3 // 4 if len(previous_questions) > PROMPT_QUESTION_DIGEST_SIZE else budget
 
-        # Initialize speech recognition
-        self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
+    recent = []
+    used = 0
+    for question in reversed(previous_questions[-PROMPT_QUESTION_DIGEST_SIZE:]):
+        words = question.split()
+        if len(words) > PROMPT_QUESTION_MAX_WORDS:
+            words = words[:PROMPT_QUESTION_MAX_WORDS] + ["..."]
+        line = f"- {' '.join(words)}"
+        cost = estimate_tokens(line)
+        if used + cost > recent_budget:
+            break
+        recent.insert(0, line)
+        used += cost
 
+    older = previous_questions[:len(previous_questions) - len(recent)]
+    summary = ""
+    if older:
+        prefix = f"- {len(older)} earlier questions covered: "
+        for subtopic in covered_subtopics(older):
+            candidate = f"{summary}, {subtopic}" if summary else subtopic
+            if used + estimate_tokens(prefix + candidate) > budget:
+                break
+            summary = candidate
+
+    lines = ([prefix + summary] if summary else []) + recent
+    return "\n".join(lines) if lines else "None yet."
+
+def normalize_question(question):
+    """Normalize a question for duplicate detection"""
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+class InterviewMate:
+    """Headless LLM-only interviewer used by the web app"""
+
+    def __init__(self, api_key=None):
         # Initialize LLM with provided API key
         self.setup_llm(api_key)
 
@@ -66,11 +134,20 @@ class VoiceEnabledInterviewMate:
         if not api_key:
             raise ValueError("API key is required")
         
+        # Async calls are rate limited and retried per key by the shared scheduler
+        self.rate_limit_key = hashlib.sha256(api_key.encode()).hexdigest()
+
+        # Each instance owns its async HTTP pool so it can be closed on eviction
+        self.http_async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=5)
+        )
         self.llm = ChatOpenAI(
             base_url="https://models.inference.ai.azure.com",
             api_key=api_key,
             model="gpt-4o-mini",
             temperature=0.1,
+            http_async_client=self.http_async_client,
+            max_retries=0,  # The scheduler retries with backoff instead
         )
 
         # Setup chains
@@ -81,6 +158,12 @@ class VoiceEnabledInterviewMate:
             | StrOutputParser()
         )
 
+        self.batch_question_chain = (
+            PromptTemplate(input_variables=["job_topic", "question_number", "previous_questions", "count"], template=batch_question_template)
+            | self.llm
+            | JsonOutputParser()
+        )
+
         self.feedback_chain = (
             {"job_topic": RunnablePassthrough(), "question": RunnablePassthrough(), "answer": RunnablePassthrough()}
             | PromptTemplate(input_variables=["job_topic", "question", "answer"], template=feedback_template)
@@ -88,6 +171,142 @@ class VoiceEnabledInterviewMate:
             | StrOutputParser()
         )
 
+    def _question_inputs(self, job_topic, question_number, previous_questions):
+        """Build the question prompt variables"""
+        return {
+            "job_topic": job_topic, 
+            "question_number": question_number,
+            "previous_questions": question_digest(previous_questions)
+        }
+
+    def _validate_questions(self, questions, previous_questions, count):
+        """Keep up to count well-formed questions that are new to the session"""
+        if not isinstance(questions, list):
+            raise ValueError(f"Expected a list of questions, got {type(questions).__name__}")
+
+        # Rejects exact and paraphrased repeats, within the batch too
+        index = QuestionIndex(previous_questions)
+        valid = []
+        for question in questions:
+            if not isinstance(question, str) or not question.strip():
+                continue
+            if index.is_duplicate(question):
+                continue
+            index.add(question)
+            valid.append(question.strip())
+        return valid[:count]
+
+    def _feedback_inputs(self, job_topic, question, answer):
+        """Build the feedback prompt variables"""
+        return {
+            "job_topic": job_topic,
+            "question": question, 
+            "answer": answer
+        }
+
+    def _usage_config(self, chain_name, template, inputs):
+        """Run config that reports the prompt tokens of this call"""
+        estimated = estimate_tokens(template.format(**inputs))
+        return {"run_name": chain_name, "callbacks": [TokenUsageCallback(chain_name, estimated)]}
+
+    def generate_question(self, job_topic, question_number, previous_questions):
+        """Generate an interview question"""
+        inputs = self._question_inputs(job_topic, question_number, previous_questions)
+        return self.question_chain.invoke(inputs, config=self._usage_config("question_chain", question_template, inputs))
+    
+    def generate_questions(self, job_topic, question_number, count, previous_questions):
+        """Generate several new interview questions in a single LLM call"""
+        inputs = {**self._question_inputs(job_topic, question_number, previous_questions), "count": count}
+        questions = self.batch_question_chain.invoke(inputs, config=self._usage_config("batch_question_chain", batch_question_template, inputs))
+        return self._validate_questions(questions, previous_questions, count)
+    
+    def generate_feedback(self, job_topic, question, answer):
+        """Generate feedback for an answer"""
+        inputs = self._feedback_inputs(job_topic, question, answer)
+        return self.feedback_chain.invoke(inputs, config=self._usage_config("feedback_chain", feedback_template, inputs))
+
+    async def agenerate_question(self, job_topic, question_number, previous_questions):
+        """Generate an interview question without blocking the event loop"""
+        inputs = self._question_inputs(job_topic, question_number, previous_questions)
+        return await scheduler.run(self.rate_limit_key, lambda: self.question_chain.ainvoke(
+            inputs, config=self._usage_config("question_chain", question_template, inputs)
+        ))
+
+    async def agenerate_questions(self, job_topic, question_number, count, previous_questions):
+        """Generate several new interview questions in a single LLM call without blocking"""
+        inputs = {**self._question_inputs(job_topic, question_number, previous_questions), "count": count}
+        questions = await scheduler.run(self.rate_limit_key, lambda: self.batch_question_chain.ainvoke(
+            inputs, config=self._usage_config("batch_question_chain", batch_question_template, inputs)
+        ))
+        return self._validate_questions(questions, previous_questions, count)
+
+    async def agenerate_feedback(self, job_topic, question, answer):
+        """Generate feedback for an answer without blocking the event loop"""
+        inputs = self._feedback_inputs(job_topic, question, answer)
+        return await scheduler.run(self.rate_limit_key, lambda: self.feedback_chain.ainvoke(
+            inputs, config=self._usage_config("feedback_chain", feedback_template, inputs)
+        ))
+
+    async def astream_feedback(self, job_topic, question, answer):
+        """Yield feedback text chunks as the model produces them"""
+        inputs = self._feedback_inputs(job_topic, question, answer)
+        async for chunk in scheduler.stream(self.rate_limit_key, lambda: self.feedback_chain.astream(
+            inputs, config=self._usage_config("feedback_chain", feedback_template, inputs)
+        )):
+            yield chunk
+
+    async def aclose(self):
+        """Close the HTTP connections held by this instance"""
+        await self.http_async_client.aclose()
+
+class VoiceEnabledInterviewMate(InterviewMate):
+    """Desktop interviewer with local text-to-speech and speech recognition
+
+    The pyttsx3 and speech_recognition engines are only loaded when the voice
+    features are first used, so importing this module stays cheap.
+    """
+
+    def __init__(self, api_key=None):
+        self._engine = None
+        self._recognizer = None
+        self._microphone = None
+        self._calibrated = False
+
+        # The CLI session asks for the API key itself
+        if api_key:
+            self.setup_llm(api_key)
+
+    @property
+    def engine(self):
+        """Text-to-speech engine, initialized on first use"""
+        if self._engine is None:
+            import pyttsx3
+
+            self._engine = pyttsx3.init()
+            self._engine.setProperty('rate', 150)
+            self._engine.setProperty('volume', 0.9)
+            voices = self._engine.getProperty('voices')
+            self._engine.setProperty('voice', voices[1].id)  # Female voice
+        return self._engine
+
+    @property
+    def recognizer(self):
+        """Speech recognizer, initialized on first use"""
+        if self._recognizer is None:
+            import speech_recognition as sr
+
+            self._recognizer = sr.Recognizer()
+        return self._recognizer
+
+    @property
+    def microphone(self):
+        """Microphone input, opened on first use"""
+        if self._microphone is None:
+            import speech_recognition as sr
+
+            self._microphone = sr.Microphone()
+        return self._microphone
+
     def speak(self, text):
         """Convert text to speech"""
         print(text)
@@ -96,9 +315,15 @@ class VoiceEnabledInterviewMate:
 
     def listen(self):
         """Listen to user input via microphone"""
+        import speech_recognition as sr
+
         with self.microphone as source:
+            if not self._calibrated:
+                # Once per session; the recognizer keeps adapting its energy
+                # threshold on its own afterwards
+                self.recognizer.adjust_for_ambient_noise(source, duration=1.5)
+                self._calibrated = True
             print("Listening...")
-            self.recognizer.adjust_for_ambient_noise(source, duration=1.5)
             audio = self.recognizer.listen(source)
             
             try:
@@ -146,24 +371,6 @@ class VoiceEnabledInterviewMate:
             
             return "\n".join(answer_lines)
 
-    def generate_question(self, job_topic, question_number, previous_questions):
-        """Generate an interview question"""
-        prev_questions_formatted = "\n".join([f"- {q}" for q in previous_questions]) if previous_questions else "None yet."
-        
-        return self.question_chain.invoke({
-            "job_topic": job_topic, 
-            "question_number": question_number,
-            "previous_questions": prev_questions_formatted
-        })
-    
-    def generate_feedback(self, job_topic, question, answer):
-        """Generate feedback for an answer"""
-        return self.feedback_chain.invoke({
-            "job_topic": job_topic,
-            "question": question, 
-            "answer": answer
-        })
-
     def run_interview_session(self):
         """Run the interview practice session"""
         self.speak("Welcome to InterviewMate Practice System!")
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+from redis_session_manager import get_redis_client
+from session_manager import uses_redis
+from ttl_cache import AsyncTTLCache
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Content-addressed cache of generated feedback. Identical (job_topic,
+# question, answer) triples - retries, double submits, refreshes - are served
+# from an in-process L1 and then Redis instead of paying for another LLM call.
+# Without Redis (Session_Backend=memory) the L1 is the only tier.
+
+FEEDBACK_CACHE_ENABLED = os.getenv("Feedback_Cache_Enabled", "true").lower() == "true"
+FEEDBACK_CACHE_TTL = int(os.getenv("Feedback_Cache_TTL", "86400"))
+FEEDBACK_CACHE_MAX_ENTRIES = int(os.getenv("Feedback_Cache_Max_Entries", "10000"))
+FEEDBACK_CACHE_L1_SIZE = int(os.getenv("Feedback_Cache_L1_Size", "256"))
+
+FEEDBACK_INDEX_KEY = "feedback_cache:index"
+
+# Entries expire on their own after FEEDBACK_CACHE_TTL. The index, scored by
+# write time, caps how many there are: the oldest ones are deleted by the
+# client rather than in a Lua script, since a script should only touch the
+# keys it declares and the evicted entries are not known in advance.
+
+local_cache = AsyncTTLCache(max_size=FEEDBACK_CACHE_L1_SIZE, ttl=FEEDBACK_CACHE_TTL)
+
+def _cache_key(job_topic: str, question: str, answer: str) -> str:
+    content = json.dumps([job_topic.strip().lower(), question.strip(), answer.strip()])
+    return f"feedback_cache:{hashlib.sha256(content.encode()).hexdigest()}"
+
+async def get_cached_feedback(job_topic: str, question: str, answer: str) -> Optional[str]:
+    """Return stored feedback for this exact question and answer, if any"""
+    if not FEEDBACK_CACHE_ENABLED:
+        return None
+
+    key = _cache_key(job_topic, question, answer)
+    feedback = local_cache.get(key)
+    if feedback is not None or not uses_redis():
+        return feedback
+
+    try:
+        feedback = await get_redis_client().get(key)
+    except Exception as e:
+        logger.error("Error reading feedback cache: %s: %s", type(e).__name__, e)
+        return None
+
+    if feedback is not None:
+        local_cache.set(key, feedback)
+    return feedback
+
+async def cache_feedback(job_topic: str, question: str, answer: str, feedback: str) -> None:
+    """Remember generated feedback in both cache tiers"""
+    if not FEEDBACK_CACHE_ENABLED or not feedback:
+        return
+
+    key = _cache_key(job_topic, question, answer)
+    local_cache.set(key, feedback)
+    if not uses_redis():
+        return
+
+    try:
+        client = get_redis_client()
+        now = time.time()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.set(key, feedback, ex=FEEDBACK_CACHE_TTL)
+            pipe.zadd(FEEDBACK_INDEX_KEY, {key: now})
+            # Entries that already expired no longer count towards the limit
+            pipe.zremrangebyscore(FEEDBACK_INDEX_KEY, "-inf", now - FEEDBACK_CACHE_TTL)
+            pipe.expire(FEEDBACK_INDEX_KEY, FEEDBACK_CACHE_TTL)
+            pipe.zcard(FEEDBACK_INDEX_KEY)
+            size = (await pipe.execute())[-1]
+
+        overflow = size - FEEDBACK_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            # ZPOPMIN hands each evicted key to exactly one worker
+            evicted = await client.zpopmin(FEEDBACK_INDEX_KEY, overflow)
+            if evicted:
+                async with client.pipeline(transaction=False) as pipe:
+                    for evicted_key, _ in evicted:
+                        pipe.unlink(evicted_key)
+                    await pipe.execute()
+    except Exception as e:
+        logger.error("Error writing feedback cache: %s: %s", type(e).__name__, e)
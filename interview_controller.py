@@ -1,22 +1,168 @@
-from chatbot import VoiceEnabledInterviewMate
-from redis_session_manager import update_session, get_session
+from chatbot import InterviewMate
+from question_similarity import QuestionIndex
+from request_session import RequestSession
+from session_manager import delete_session, get_session, update_session
+from ttl_cache import AsyncTTLCache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import question_bank
+import feedback_cache
+from single_flight import Flight, in_flight, run_once
+from llm_scheduler import LLMRateLimited
+from app_logging import get_logger, Redacted
 import asyncio
+import hashlib
+import os
+import random
 
-# Create a cache for InterviewMate instances to avoid recreating them
-interview_mates = {}
+logger = get_logger(__name__)
 
-async def get_interview_mate(api_key: str) -> VoiceEnabledInterviewMate:
+# Number of questions to keep generated ahead of the user, 0 disables prefetching
+QUESTION_PREFETCH_COUNT = int(os.getenv("Question_Prefetch_Count", "2"))
+
+# Tries to get a question that is not a near-duplicate of an earlier one
+QUESTION_GENERATION_ATTEMPTS = 2
+
+# Evicted clients are closed after this delay so in-flight LLM calls can finish
+INTERVIEW_MATE_CLOSE_DELAY = 120  # seconds
+
+def _close_interview_mate(key: str, interview_mate: InterviewMate) -> None:
+    """Close an evicted InterviewMate's HTTP clients once in-flight calls are done"""
+    async def close_later():
+        await asyncio.sleep(INTERVIEW_MATE_CLOSE_DELAY)
+        await interview_mate.aclose()
+
+    try:
+        asyncio.get_running_loop().create_task(close_later())
+    except RuntimeError:
+        # No running loop, e.g. at interpreter shutdown - nothing left to wait for
+        pass
+
+# Bounded cache of InterviewMate instances, keyed by a hash of the API key
+interview_mates = AsyncTTLCache(
+    max_size=int(os.getenv("LLM_Client_Cache_Size", "256")),
+    ttl=float(os.getenv("LLM_Client_Cache_TTL", "1800")),
+    on_evict=_close_interview_mate
+)
+
+async def get_interview_mate(api_key: str) -> InterviewMate:
     """Get or create an InterviewMate instance for the given API key"""
-    if api_key not in interview_mates:
-        interview_mate = VoiceEnabledInterviewMate(api_key)
-        interview_mates[api_key] = interview_mate
-    return interview_mates[api_key]
+    # Only a digest of the key is kept as the cache key
+    key = hashlib.sha256(api_key.encode()).hexdigest()
+    # Headless interviewer - the server never needs local audio devices
+    return await interview_mates.get_or_create(key, lambda: asyncio.to_thread(InterviewMate, api_key))
+
+async def close_interview_mates() -> None:
+    """Close every cached InterviewMate immediately, e.g. on shutdown"""
+    cached = interview_mates.drain()
+    await asyncio.gather(*(interview_mate.aclose() for interview_mate in cached), return_exceptions=True)
+
+# Running prefetch tasks by session_id, so a session never has two at once
+prefetch_tasks: Dict[str, asyncio.Task] = {}
+
+def _asked_questions(session: RequestSession) -> List[str]:
+    """Questions already asked, current or waiting in the queue
+
+    previous_questions must have been loaded with ``load_history``.
+    """
+    asked = list(session.get("previous_questions") or [])
+    if session.get("current_question"):
+        asked.append(session["current_question"])
+    asked.extend(item["question"] for item in session.get("question_queue") or [])
+    return asked
+
+async def _collect_questions(api_key: str, job_topic: str, question_number: int, count: int,
+                             asked: List[str], bank_offset: int, bank_cursor: int) -> Tuple[List[str], int]:
+    """Take unseen questions from the shared bank, generating only what it lacks
+
+    Returns the questions and the session's advanced bank cursor.
+    """
+    questions, bank_cursor = await question_bank.draw_questions(
+        job_topic, bank_offset, bank_cursor, count, QuestionIndex(asked)
+    )
+
+    missing = count - len(questions)
+    if missing > 0:
+        interview_mate = await get_interview_mate(api_key)
+        generated = await interview_mate.agenerate_questions(
+            job_topic, question_number + len(questions), missing, asked + questions
+        )
+        await question_bank.add_questions(job_topic, generated)
+        questions += generated
+
+    return questions, bank_cursor
+
+async def _prefetch_questions(session_id: str, api_key: str, job_topic: str, question_number: int,
+                              asked: List[str], count: int, bank_offset: int, bank_cursor: int) -> None:
+    """Generate questions ahead of time and queue them in the session"""
+    try:
+        questions, bank_cursor = await _collect_questions(
+            api_key, job_topic, question_number, count, asked, bank_offset, bank_cursor
+        )
+        queued = [{"question": question, "job_topic": job_topic} for question in questions]
+
+        # The session may have been deleted by another worker meanwhile, and
+        # an update would bring it back
+        if queued and await get_session(session_id, history=False) is not None:
+            await update_session(session_id, bank_cursor=bank_cursor, appends={"question_queue": queued})
+            logger.debug("Prefetched %d questions for session %s", len(queued), session_id)
+    except Exception as e:
+        logger.error("Error prefetching questions: %s: %s", type(e).__name__, e)
+    finally:
+        if prefetch_tasks.get(session_id) is asyncio.current_task():
+            del prefetch_tasks[session_id]
 
-async def setup_interview(session: dict, job_topic: str, questions_per_round: int, use_voice: bool) -> None:
+async def delete_interview_session(session_id: str) -> bool:
+    """Delete a session, first stopping a prefetch that would write it back"""
+    task = prefetch_tasks.pop(session_id, None)
+    if task is not None:
+        task.cancel()
+    return await delete_session(session_id)
+
+async def schedule_prefetch(session: RequestSession) -> None:
+    """Start filling the session's question queue in the background"""
+    missing = QUESTION_PREFETCH_COUNT - len(session.get("question_queue") or [])
+    if missing <= 0 or session.session_id in prefetch_tasks:
+        return
+    if not session.get("api_key") or not session.get("job_topic"):
+        return
+
+    await session.load_history("previous_questions")
+    if session.session_id in prefetch_tasks:
+        return
+
+    prefetch_tasks[session.session_id] = asyncio.get_running_loop().create_task(_prefetch_questions(
+        session.session_id,
+        session["api_key"],
+        session["job_topic"],
+        session.get("question_number", 1) + 1,
+        _asked_questions(session),
+        missing,
+        session.get("bank_offset", 0),
+        session.get("bank_cursor", 0)
+    ))
+
+async def _take_queued_question(session: RequestSession) -> Optional[str]:
+    """Pop the next ready question that has not been asked in this session"""
+    if not session.get("question_queue"):
+        return None
+
+    await session.load_history("previous_questions")
+    index = None
+    while session.get("question_queue"):
+        item = session.pop_front("question_queue")[0]
+        # Skip leftovers from an earlier topic and anything already asked
+        if item.get("job_topic") != session.get("job_topic"):
+            continue
+        index = index or QuestionIndex(session.get("previous_questions") or [])
+        if not index.is_duplicate(item["question"]):
+            return item["question"]
+    return None
+
+async def setup_interview(session: RequestSession, job_topic: str, questions_per_round: int, use_voice: bool) -> None:
     """Setup interview parameters"""
-    # Make sure we have the required session_id and api_key
-    if "session_id" not in session or "api_key" not in session:
-        print("Error: Missing session_id or api_key in session")
+    # Make sure we have the required api_key
+    if not session or "api_key" not in session:
+        logger.error("Missing session or api_key in session")
         return None
 
     # Initialize session with interview parameters
@@ -27,171 +173,288 @@ async def setup_interview(session: dict, job_topic: str, questions_per_round: in
         "use_voice": use_voice,
         "question_number": 1,
         "previous_questions": [],
-        "completed_questions": []
+        "completed_questions": [],
+        "question_queue": [],
+        # Where this session starts walking the shared question bank
+        "bank_offset": random.randrange(2 ** 30),
+        "bank_cursor": 0
     }
     
-    print(f"Setting up interview with data: {session_data}")  # Debug print
+    # Fill the first round up front - from the question bank where possible,
+    # otherwise with a single batched LLM call
+    try:
+        questions, session_data["bank_cursor"] = await _collect_questions(
+            session["api_key"], job_topic, 1, questions_per_round, [], session_data["bank_offset"], 0
+        )
+        session_data["question_queue"] = [{"question": question, "job_topic": job_topic} for question in questions]
+    except Exception as e:
+        # Questions are then generated one at a time as the interview goes
+        logger.error("Error generating question batch: %s: %s", type(e).__name__, e)
     
-    # Update session with interview parameters
-    success = await update_session(
-        session["session_id"],
-        **session_data
-    )
+    logger.debug("Setting up interview with data: %s", Redacted(session_data))
     
-    if not success:
-        print("Error: Failed to update session in Redis")
-        return None
+    # Changes are written to Redis when the request's session is flushed
+    session.update(**session_data)
+
+async def _produce_question(session: RequestSession) -> Optional[str]:
+    """Take the next question from the queue or bank, or generate one"""
+    # Use a prefetched question when one is ready
+    question = await _take_queued_question(session)
+    
+    # Then an unseen question from the shared bank for this topic
+    if not question:
+        await session.load_history("previous_questions")
+        drawn, bank_cursor = await question_bank.draw_questions(
+            session["job_topic"],
+            session.get("bank_offset", 0),
+            session.get("bank_cursor", 0),
+            1,
+            QuestionIndex(session.get("previous_questions") or [])
+        )
+        if drawn:
+            question = drawn[0]
+            session.update(bank_cursor=bank_cursor)
+    
+    if not question:
+        interview_mate = await get_interview_mate(session["api_key"])
+        previous_questions = list(session.get("previous_questions") or [])
+        index = QuestionIndex(previous_questions)
+        
+        # Generate question using the InterviewMate, rejecting paraphrased repeats
+        for _ in range(QUESTION_GENERATION_ATTEMPTS):
+            question = await interview_mate.agenerate_question(
+                session["job_topic"],
+                session.get("question_number", 1),
+                previous_questions
+            )
+            if not question or not index.is_duplicate(question):
+                break
+            logger.info("Rejected near-duplicate question", extra={"question": question})
+            # Show the rejected question to the model on the next attempt
+            previous_questions.append(question)
+        
+        if question:
+            await question_bank.add_questions(session["job_topic"], [question])
+    
+    return question
 
-async def generate_question(session: dict) -> str:
-    """Generate an interview question"""
+async def generate_question(session: RequestSession) -> str:
+    """Generate an interview question, or None on failure
+
+    LLMRateLimited is raised rather than logged away.
+    """
     try:
         # Validate input session
         if not session:
-            print("Error: Session is None or empty")
+            logger.error("Session is None or empty")
             return None
             
-        if not isinstance(session, dict):
-            print(f"Error: Session is not a dictionary, got {type(session)}")
-            return None
-            
-        if "session_id" not in session:
-            print("Error: No session_id in session object")
-            return None
-            
-        print(f"Attempting to generate question for session: {session}")  # Debug print
-        
-        # First, get the latest session data from Redis
-        session_data = await get_session(session["session_id"])
-        if not session_data:
-            print(f"Error: No session data found in Redis for session_id: {session['session_id']}")
+        if not isinstance(session, RequestSession):
+            logger.error("Session is not a RequestSession, got %s", type(session))
             return None
         
         # Ensure we have all required fields
-        if "api_key" not in session_data:
-            print("Error: No api_key in session data")
+        if "api_key" not in session:
+            logger.error("No api_key in session data")
             return None
             
-        if "job_topic" not in session_data:
-            print("Error: No job_topic in session data")
+        if "job_topic" not in session:
+            logger.error("No job_topic in session data")
             return None
 
-        print(f"Retrieved session data: {session_data}")  # Debug print
+        logger.debug("Generating question for session: %s", Redacted(session.data))
 
-        interview_mate = await get_interview_mate(session_data["api_key"])
-        
-        # Generate question using the InterviewMate
-        question = interview_mate.generate_question(
-            session_data["job_topic"],
-            session_data.get("question_number", 1),
-            session_data.get("previous_questions", [])
+        # A reload while the question is being generated shares the same
+        # result. The key names the step - the interview (its random bank
+        # offset) and how many questions were asked - so a result left over
+        # from an earlier step is never served for this one
+        await session.load_history("previous_questions")
+        step = f"{session.get('bank_offset', 0)}:{len(session.get('previous_questions') or [])}"
+        question, _ = await run_once(
+            f"{session.session_id}:question:{step}",
+            lambda: _produce_question(session)
         )
         
         if not question:
-            print("Error: Failed to generate question from InterviewMate")
+            logger.error("Failed to generate question from InterviewMate")
             return None
             
-        print(f"Generated question: {question}")  # Debug print
+        logger.debug("Generated question: %s", Redacted(question))
         
         # Update session with the new question
-        update_success = await update_session(
-            session["session_id"],
+        session.update(
             current_question=question,
             current_answer=None,
             feedback=None
         )
         
-        if not update_success:
-            print("Error: Failed to update session with new question")
-            return None
-        
         return question
         
+    except LLMRateLimited:
+        # Callers show a rate limit differently from a failed generation
+        raise
     except Exception as e:
-        print(f"Unexpected error in generate_question: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Unexpected error in generate_question: %s", e)
         return None
 
-async def submit_answer(session: dict, answer: str) -> str:
+def _feedback_flight_key(session: RequestSession, answer: str) -> str:
+    """Flight key for evaluating this answer, so a different answer never shares it"""
+    digest = hashlib.sha256(f"{session.get('current_question')}\n{answer}".encode()).hexdigest()[:16]
+    return f"{session.session_id}:feedback:{digest}"
+
+def _answer_evaluated(session: RequestSession, answer: str) -> bool:
+    """The answer's feedback is already recorded or being generated"""
+    if session.get("current_answer") != answer:
+        return False
+    return bool(session.get("feedback")) or in_flight(_feedback_flight_key(session, answer))
+
+def _record_feedback(session: RequestSession, answer: str, feedback: str) -> None:
+    """Store the answer and feedback, and append to completed questions"""
+    session.update(
+        current_answer=answer,
+        feedback=feedback
+    )
+    session.append("completed_questions", {
+        "question": session["current_question"],
+        "answer": answer,
+        "feedback": feedback,
+        "question_number": session["question_number"]
+    })
+
+async def _produce_feedback(session: RequestSession, answer: str) -> str:
+    """Feedback from the cache, or generated by the LLM and cached"""
+    # Identical answers to the same question reuse earlier feedback
+    feedback = await feedback_cache.get_cached_feedback(
+        session["job_topic"],
+        session["current_question"],
+        answer
+    )
+    
+    if not feedback:
+        interview_mate = await get_interview_mate(session["api_key"])
+        
+        # Generate feedback
+        feedback = await interview_mate.agenerate_feedback(
+            session["job_topic"],
+            session["current_question"],
+            answer
+        )
+        await feedback_cache.cache_feedback(session["job_topic"], session["current_question"], answer, feedback)
+    
+    return feedback
+
+async def submit_answer(session: RequestSession, answer: str) -> str:
     """Process answer and generate feedback"""
-    # Get the latest session data
-    session_data = await get_session(session["session_id"])
-    if not session_data:
-        print("Error: No session data found in Redis")
+    if not session:
+        logger.error("No session data found in Redis")
         return None
     
-    interview_mate = await get_interview_mate(session_data["api_key"])
+    # The same answer was already evaluated, e.g. a resubmitted request
+    if session.get("feedback") and session.get("current_answer") == answer:
+        return session["feedback"]
     
-    # Store the answer
-    await update_session(
-        session["session_id"],
-        current_answer=answer
-    )
+    # Prepare upcoming questions while feedback is generated and read
+    await schedule_prefetch(session)
     
-    # Generate feedback
-    feedback = interview_mate.generate_feedback(
-        session_data["job_topic"],
-        session_data["current_question"],
-        answer
+    # A double submit waits for the in-flight evaluation instead of starting another
+    feedback, shared = await run_once(
+        _feedback_flight_key(session, answer),
+        lambda: _produce_feedback(session, answer)
     )
     
-    # Update session with feedback
-    await update_session(
-        session["session_id"],
-        feedback=feedback
-    )
+    if shared:
+        # The leading request records the completed question; only mirror its state
+        session.update(current_answer=answer, feedback=feedback)
+    else:
+        _record_feedback(session, answer, feedback)
     
-    # Add to completed questions
-    completed_questions = session_data.get("completed_questions", [])
-    completed_questions.append({
-        "question": session_data["current_question"],
-        "answer": answer,
-        "feedback": feedback,
-        "question_number": session_data["question_number"]
-    })
+    return feedback
+
+async def store_answer(session: RequestSession, answer: str) -> None:
+    """Store the answer so its feedback can be streamed afterwards"""
+    # A resubmitted answer keeps its recorded or in-flight feedback; clearing
+    # it would evaluate and record the same answer a second time
+    if _answer_evaluated(session, answer):
+        return
     
-    # Update completed questions in session
-    await update_session(
-        session["session_id"],
-        completed_questions=completed_questions
+    session.update(
+        current_answer=answer,
+        feedback=None
     )
     
-    return feedback
+    # Prepare upcoming questions while feedback is streamed and read
+    await schedule_prefetch(session)
+
+async def stream_feedback(session: RequestSession) -> AsyncIterator[str]:
+    """Stream feedback for the stored answer, recording it once complete"""
+    answer = session["current_answer"]
+    
+    async with Flight(_feedback_flight_key(session, answer)) as flight:
+        if not flight.leader:
+            # Another request is already evaluating this answer - share its result
+            session.update(current_answer=answer, feedback=flight.result)
+            yield flight.result
+            return
+        
+        # Identical answers to the same question reuse earlier feedback
+        feedback = await feedback_cache.get_cached_feedback(
+            session["job_topic"],
+            session["current_question"],
+            answer
+        )
+        if feedback:
+            yield feedback
+        else:
+            interview_mate = await get_interview_mate(session["api_key"])
+            
+            chunks = []
+            async for chunk in interview_mate.astream_feedback(
+                session["job_topic"],
+                session["current_question"],
+                answer
+            ):
+                chunks.append(chunk)
+                yield chunk
+            
+            feedback = "".join(chunks)
+            await feedback_cache.cache_feedback(session["job_topic"], session["current_question"], answer, feedback)
+        
+        flight.result = feedback
+        _record_feedback(session, answer, feedback)
 
-async def continue_interview(session: dict) -> None:
+async def continue_interview(session: RequestSession) -> None:
     """Continue to the next question"""
-    # Get the latest session data
-    session_data = await get_session(session["session_id"])
-    if not session_data:
-        print("Error: No session data found in Redis")
+    if not session:
+        logger.error("No session data found in Redis")
         return None
     
     # Add current question to previous questions list
-    previous_questions = session_data.get("previous_questions", [])
-    if session_data.get("current_question") and session_data["current_question"] not in previous_questions:
-        previous_questions.append(session_data["current_question"])
+    await session.load_history("previous_questions")
+    previous_questions = session.get("previous_questions", [])
+    if session.get("current_question") and session["current_question"] not in previous_questions:
+        session.append("previous_questions", session["current_question"])
     
     # Calculate next question number
-    next_question_number = session_data.get("question_number", 1) + 1
+    next_question_number = session.get("question_number", 1) + 1
     
     # Check if we've reached the end of the round
-    if next_question_number > session_data.get("questions_per_round", 0):
+    if next_question_number > session.get("questions_per_round", 0):
         next_question_number = 1
     
     # Update session for next question
-    await update_session(
-        session["session_id"],
-        previous_questions=previous_questions,
+    session.update(
         question_number=next_question_number,
         current_question=None,
         current_answer=None,
         feedback=None
     )
+    
+    # Move straight to a prefetched question when one is ready
+    queued_question = await _take_queued_question(session)
+    if queued_question:
+        session.update(current_question=queued_question)
 
-async def end_interview(session: dict) -> None:
+async def end_interview(session: RequestSession) -> None:
     """End the interview session and prepare summary"""
     # Just mark that we've finished - the summary page will use completed_questions
-    await update_session(
-        session["session_id"],  # Use session_id from the session object
-        interview_complete=True
-    )
\ No newline at end of file
+    session.update(interview_complete=True)
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, WebSocket
+from api_v1 import RATE_LIMITED_DETAIL, interview_state
+from request_session import RequestSession, get_socket_session
+from llm_scheduler import LLMRateLimited
+from interview_controller import (
+    generate_question,
+    store_answer,
+    stream_feedback,
+    continue_interview,
+    end_interview,
+    prefetch_tasks
+)
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# One WebSocket carries a whole interview: questions are pushed, answers come
+# in as messages and feedback goes out token by token. The session is loaded
+# once per connection and kept in memory; changes are checkpointed to the
+# session store only at turn boundaries (feedback recorded, next question
+# chosen, interview ended) and when the connection closes. A reconnect for
+# the same session takes over from the old connection after its last
+# checkpoint, so the client resumes exactly where it left off. Connections
+# are tracked per process, so takeover needs a single worker or routing that
+# keeps a session on one worker.
+#
+# Client messages:  {"type": "answer", "answer": ..., "question": ...}
+#                   {"type": "next"}, {"type": "end"}, {"type": "state"}, {"type": "ping"}
+# Server messages:  state, question, feedback (one per token), feedback_done,
+#                   summary, error, pong
+#
+# Browsers authenticate with the session cookie; other clients pass the API
+# token as the ``token`` query parameter.
+
+router = APIRouter(prefix="/api/v1")
+
+# Seconds without a client message before the connection is closed
+IDLE_TIMEOUT = float(os.getenv("Interview_Socket_Idle_Timeout", "900"))
+
+# Application close codes; clients should not reconnect after these
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NO_INTERVIEW = 4404
+CLOSE_IDLE = 4408
+CLOSE_SUPERSEDED = 4409
+
+# Open connections by session_id
+connections: Dict[str, "InterviewConnection"] = {}
+counters = {"connections": 0, "takeovers": 0, "turns": 0, "checkpoint_failures": 0}
+
+def stats() -> Dict[str, int]:
+    return {"open": len(connections), **counters}
+
+class InterviewConnection:
+    """One client's interview over a WebSocket, with its session held in memory"""
+
+    def __init__(self, websocket: WebSocket, session: RequestSession):
+        self.websocket = websocket
+        self.session = session
+        self.connected = True
+        self.close_code = 1000
+        # Set by a newer connection for the same session
+        self.superseded = asyncio.Event()
+        # Set once the final checkpoint is written
+        self.closed = asyncio.Event()
+        # Prefetch started by the last answer, whose questions land in the store
+        self.prefetch: Optional[asyncio.Task] = None
+
+    @property
+    def session_id(self) -> str:
+        return self.session.session_id
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        """Send to the client; a turn in progress still completes after it has left"""
+        if not self.connected:
+            return
+        try:
+            await self.websocket.send_text(json.dumps(message))
+        except Exception:
+            self.connected = False
+
+    async def send_error(self, error: str, code: str) -> None:
+        await self.send({"type": "error", "error": error, "code": code})
+
+    async def checkpoint(self) -> None:
+        """Write the changes buffered since the last turn boundary"""
+        if not await self.session.flush():
+            counters["checkpoint_failures"] += 1
+
+    async def receive(self) -> Optional[Dict[str, Any]]:
+        """Next client message, or None once the client left, idled out or was superseded"""
+        receiving = asyncio.ensure_future(self.websocket.receive_text())
+        superseded = asyncio.ensure_future(self.superseded.wait())
+        done, _ = await asyncio.wait({receiving, superseded}, timeout=IDLE_TIMEOUT,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        superseded.cancel()
+
+        if self.superseded.is_set():
+            receiving.cancel()
+            self.close_code = CLOSE_SUPERSEDED
+            return None
+        if receiving not in done:
+            receiving.cancel()
+            self.close_code = CLOSE_IDLE
+            return None
+
+        try:
+            text = receiving.result()
+        except Exception:
+            # WebSocketDisconnect, or a receive after the client closed
+            self.connected = False
+            return None
+
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            return {"type": "invalid"}
+        return message
+
+    async def take_over(self) -> bool:
+        """Register as the session's connection, waiting for an older one to checkpoint
+
+        Returns False if the session was deleted in the meantime.
+        """
+        previous = connections.get(self.session_id)
+        connections[self.session_id] = self
+        if previous is None:
+            return True
+
+        counters["takeovers"] += 1
+        previous.superseded.set()
+        await previous.closed.wait()
+        # Reload to pick up what the old connection wrote last
+        fresh = await RequestSession.load(self.session_id)
+        if fresh is None:
+            return False
+        self.session = fresh
+        return True
+
+    async def send_question(self) -> None:
+        """Make sure there is a current question, checkpoint and push it"""
+        if not self.session.get("current_question"):
+            # generate_question logs its own failures and returns None
+            try:
+                question = await generate_question(self.session)
+            except LLMRateLimited:
+                await self.send_error(RATE_LIMITED_DETAIL, "rate_limited")
+                return
+            if not question:
+                await self.send_error("Failed to generate interview question. Please try again.", "question_failed")
+                return
+        await self.checkpoint()
+        await self.send({"type": "question", **interview_state(self.session)})
+
+    async def sync_prefetched(self) -> None:
+        """Pick up questions prefetched in the background since the last answer"""
+        task, self.prefetch = self.prefetch, None
+        if task is None:
+            return
+        # Prefetch tasks handle their own errors; asyncio.wait keeps a
+        # disconnect here from cancelling the shared task
+        await asyncio.wait({task})
+        if not await self.session.refresh():
+            counters["checkpoint_failures"] += 1
+
+    async def on_answer(self, message: Dict[str, Any]) -> None:
+        session = self.session
+        answer = message.get("answer")
+        question = session.get("current_question")
+        if not isinstance(answer, str) or not answer.strip():
+            await self.send_error("The answer is empty.", "invalid_answer")
+            return
+        if not question:
+            await self.send_error("There is no question to answer.", "no_question")
+            return
+        if message.get("question") not in (None, question):
+            await self.send_error("That question is no longer current.", "stale_question")
+            return
+
+        round_complete = session.get("question_number", 1) >= session.get("questions_per_round", 0)
+        if not (session.get("feedback") and session.get("current_answer") == answer):
+            # A resent answer after a reconnect gets the recorded feedback instead
+            await store_answer(session, answer)
+            self.prefetch = prefetch_tasks.get(self.session_id)
+            try:
+                async for chunk in stream_feedback(session):
+                    await self.send({"type": "feedback", "token": chunk})
+            except LLMRateLimited:
+                # The stored answer is kept, so the client can simply resend it
+                await self.send_error(RATE_LIMITED_DETAIL, "rate_limited")
+                return
+            await self.checkpoint()
+            counters["turns"] += 1
+
+        await self.send({
+            "type": "feedback_done",
+            "question": question,
+            "feedback": session["feedback"],
+            "round_complete": round_complete
+        })
+
+    async def on_next(self, message: Dict[str, Any]) -> None:
+        await self.sync_prefetched()
+        await continue_interview(self.session)
+        await self.send_question()
+
+    async def on_end(self, message: Dict[str, Any]) -> None:
+        await end_interview(self.session)
+        await self.checkpoint()
+        await self.session.load_history("completed_questions")
+        await self.send({
+            "type": "summary",
+            "job_topic": self.session.get("job_topic"),
+            "completed_questions": self.session["completed_questions"]
+        })
+        self.connected = False
+
+    async def on_state(self, message: Dict[str, Any]) -> None:
+        await self.send({"type": "state", **interview_state(self.session)})
+
+    async def on_ping(self, message: Dict[str, Any]) -> None:
+        await self.send({"type": "pong"})
+
+    async def run(self) -> None:
+        handlers = {
+            "answer": self.on_answer,
+            "next": self.on_next,
+            "end": self.on_end,
+            "state": self.on_state,
+            "ping": self.on_ping,
+        }
+
+        try:
+            if not await self.take_over():
+                self.close_code = CLOSE_UNAUTHORIZED
+                return
+
+            # Resume: the client learns where it left off, including feedback
+            # already recorded for its last answer
+            await self.on_state({})
+            if not self.session.get("interview_complete") and not self.session.get("current_question"):
+                await self.send_question()
+
+            while self.connected:
+                message = await self.receive()
+                if message is None:
+                    break
+
+                handler = handlers.get(message.get("type"))
+                if handler is None:
+                    await self.send_error("Unknown message type.", "invalid_message")
+                    continue
+                try:
+                    await handler(message)
+                except Exception as e:
+                    logger.exception("Error handling %s message: %s", message.get("type"), e)
+                    await self.send_error("Something went wrong. Please try again.", "internal_error")
+        finally:
+            await self.checkpoint()
+            if connections.get(self.session_id) is self:
+                del connections[self.session_id]
+            self.closed.set()
+
+@router.websocket("/interview/ws")
+async def interview_socket(websocket: WebSocket):
+    """Full-duplex interview loop for one session"""
+    await websocket.accept()
+    session = await get_socket_session(websocket)
+    if session is None:
+        await websocket.close(code=CLOSE_UNAUTHORIZED)
+        return
+    if not session.get("job_topic"):
+        await websocket.close(code=CLOSE_NO_INTERVIEW)
+        return
+
+    counters["connections"] += 1
+    connection = InterviewConnection(websocket, session)
+    await connection.run()
+    try:
+        await websocket.close(code=connection.close_code)
+    except Exception:
+        # The client already closed the connection
+        pass
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Scheduler in front of every async chain call: a token bucket per API key
+# smooths bursts before they turn into upstream 429s, a global cap bounds the
+# number of concurrent LLM requests per worker, and waiting calls are granted
+# round-robin across keys so one busy key cannot starve the others. Calls that
+# fail with 429/5xx or a connection error are retried with jittered backoff.
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_Max_Concurrency", "32"))
+LLM_KEY_RATE = float(os.getenv("LLM_Key_Rate", "1.0"))  # requests per second per key
+LLM_KEY_BURST = int(os.getenv("LLM_Key_Burst", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_Max_Retries", "3"))
+LLM_BACKOFF_BASE = 0.5  # seconds
+LLM_BACKOFF_CAP = 20  # seconds
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class LLMRateLimited(Exception):
+    """The provider kept rejecting calls for this key after all retries"""
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def is_retryable(error: Exception) -> bool:
+    """429s, server errors and dropped connections are worth another try"""
+    if _status_code(error) in RETRYABLE_STATUS_CODES:
+        return True
+    # openai.APIConnectionError / APITimeoutError carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class _TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available"""
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else 0.0
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int, rate: float, burst: int, max_retries: int):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.active = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.metrics = {
+            "granted": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "queued_keys": len(self._queues),
+        }
+
+    def _bucket(self, key: str) -> _TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _dispatch(self) -> None:
+        """Grant free slots round-robin to keys that have a token available"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        next_wait = None
+        while self.active < self.max_concurrency and self._queues:
+            granted = False
+            for key in list(self._queues):
+                queue = self._queues[key]
+                while queue and queue[0].done():
+                    queue.popleft()  # Cancelled while waiting
+                if not queue:
+                    del self._queues[key]
+                    continue
+
+                bucket = self._bucket(key)
+                bucket.refill()
+                if bucket.tokens < 1:
+                    wait = bucket.wait_time()
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+                    continue
+
+                bucket.tokens -= 1
+                self.active += 1
+                queue.popleft().set_result(None)
+                # Move the key to the back so other keys go first next time
+                self._queues.move_to_end(key)
+                if not queue:
+                    del self._queues[key]
+                granted = True
+                break
+
+            if not granted:
+                break
+
+        if self._queues and next_wait is not None and self.active < self.max_concurrency:
+            self._timer = asyncio.get_running_loop().call_later(next_wait, self._dispatch)
+
+        # Forget idle keys whose bucket has refilled completely
+        for key in [k for k, b in self._buckets.items() if k not in self._queues]:
+            bucket = self._buckets[key]
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
+
+    async def _acquire(self, key: str) -> None:
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the caller went away - give the slot back
+                self._release()
+            raise
+
+        waited = time.monotonic() - started
+        self.metrics["granted"] += 1
+        self.metrics["wait_seconds_total"] += waited
+        self.metrics["wait_seconds_max"] = max(self.metrics["wait_seconds_max"], waited)
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        """Hold one scheduled slot for key, e.g. for the length of a stream"""
+        await self._acquire(key)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def backoff(self, error: Exception, attempt: int) -> None:
+        """Sleep before retry ``attempt``, honouring Retry-After when given"""
+        self.metrics["retries"] += 1
+        if _status_code(error) == 429:
+            self.metrics["rate_limited"] += 1
+        delay = _retry_after(error)
+        if delay is None:
+            # Full jitter keeps retries from many requests from lining up
+            delay = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** attempt))
+        logger.warning("LLM call failed (%s), retrying in %.2fs", type(error).__name__, delay)
+        await asyncio.sleep(delay)
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run an LLM call under the scheduler, retrying transient failures"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot(key):
+                    return await func()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    if _status_code(e) == 429:
+                        raise LLMRateLimited(str(e)) from e
+                    raise
+                # The slot is released while backing off
+                await self.backoff(e, attempt)
+
+    async def stream(self, key: str, func: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Stream an LLM call under the scheduler
+
+        Retries only happen before the first chunk - once output has been
+        sent on, a failure is raised to the caller.
+        """
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self.slot(key):
+                    async for chunk in func():
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                if started or not is_retryable(e) or attempt == self.max_retries:
+                    if _status_code(e) == 429:
+                        raise LLMRateLimited(str(e)) from e
+                    raise
+                await self.backoff(e, attempt)
+
+# Shared by every InterviewMate in this worker
+scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_KEY_RATE, LLM_KEY_BURST, LLM_MAX_RETRIES)
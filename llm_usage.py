@@ -0,0 +1,61 @@
+import time
+from collections import defaultdict
+from typing import Any, Dict
+from langchain_core.callbacks import BaseCallbackHandler
+from app_logging import get_logger
+import metrics
+
+logger = get_logger(__name__)
+
+# Running totals per chain, e.g. usage_stats["question_chain"]["prompt_tokens"]
+usage_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+    "calls": 0,
+    "estimated_prompt_tokens": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+})
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English text"""
+    return max(1, round(len(text) / 4))
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Reports the latency and the prompt and completion tokens of one chain call"""
+
+    def __init__(self, chain_name: str, estimated_prompt_tokens: int):
+        self.chain_name = chain_name
+        self.estimated_prompt_tokens = estimated_prompt_tokens
+        self.started = time.perf_counter()
+
+    def _record_start(self) -> None:
+        """Count a request actually sent, so configs built but never run are not counted"""
+        self.started = time.perf_counter()
+        stats = usage_stats[self.chain_name]
+        stats["calls"] += 1
+        stats["estimated_prompt_tokens"] += self.estimated_prompt_tokens
+        metrics.llm_estimated_prompt_tokens.inc(self.chain_name, amount=self.estimated_prompt_tokens)
+
+    def on_chat_model_start(self, serialized: Any, messages: Any, **kwargs: Any) -> None:
+        self._record_start()
+
+    def on_llm_start(self, serialized: Any, prompts: Any, **kwargs: Any) -> None:
+        self._record_start()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        metrics.llm_errors.inc(self.chain_name, type(error).__name__)
+        metrics.llm_call_seconds.observe(time.perf_counter() - self.started, self.chain_name)
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        metrics.llm_call_seconds.observe(time.perf_counter() - self.started, self.chain_name)
+        # Streaming responses usually carry no usage, so the estimate is all we have
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        stats = usage_stats[self.chain_name]
+        stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        stats["completion_tokens"] += usage.get("completion_tokens", 0)
+        metrics.llm_tokens.inc(self.chain_name, "prompt", amount=usage.get("prompt_tokens", 0))
+        metrics.llm_tokens.inc(self.chain_name, "completion", amount=usage.get("completion_tokens", 0))
+        logger.info("%s call finished", self.chain_name, extra={
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "estimated_prompt_tokens": self.estimated_prompt_tokens,
+            "completion_tokens": usage.get("completion_tokens"),
+        })
@@ -1,53 +1,149 @@
-from fastapi import FastAPI, Request, Form, Depends, HTTPException, status, Cookie
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, status, Cookie, Header
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.base import BaseHTTPMiddleware
+import time
 import uuid
 import os
 import aiohttp
 from typing import Optional
 import uvicorn
 from pydantic import BaseModel
-import traceback
+import json
 
 # Import from other files
-from redis_session_manager import get_session, update_session, delete_session
+from redis_session_manager import close_redis_client
+from session_manager import update_session, close_session_backend
+from request_session import FLUSH_FAILED_MESSAGE, RequestSession, SessionFlushRoute, get_request_session, get_path_session
+from llm_scheduler import LLMRateLimited, scheduler
+import metrics
+import feedback_cache
+from app_logging import get_logger
+from templating import templates, render_summary_cards
+import api_v1
+import interview_socket
+import speech_api
+import transcription
 from interview_controller import (
     setup_interview,
     generate_question,
     submit_answer,
+    store_answer,
+    stream_feedback,
     continue_interview,
-    end_interview
+    end_interview,
+    close_interview_mates,
+    delete_interview_session,
+    interview_mates
 )
 
+logger = get_logger("main")
+
 # Create FastAPI app
 app = FastAPI(title="InterviewMate Frontend")
+# Flush each request's buffered session changes before its response is sent
+app.router.route_class = SessionFlushRoute
+
+# Add middleware for error handling. A plain ASGI middleware rather than a
+# BaseHTTPMiddleware: it adds no extra task or response stream per request,
+# so streamed responses and background tasks pass through untouched.
+class ErrorLoggingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_tracking_start(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
-# Add middleware for error handling
-class ErrorLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         try:
-            response = await call_next(request)
-            return response
-        except Exception as e:
-            print(f"Error in request: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
-            return templates.TemplateResponse(
+            await self.app(scope, receive, send_tracking_start)
+        except Exception:
+            logger.exception("Error in request %s %s", scope["method"], scope["path"])
+            if response_started:
+                # Too late for an error page - let the server close the connection
+                raise
+            response = templates.TemplateResponse(
                 "error.html",
                 {
-                    "request": request,
+                    "request": Request(scope),
                     "error": "An internal server error occurred. Please try again."
                 },
                 status_code=500
             )
+            await response(scope, receive, send)
+
+class MetricsMiddleware:
+    """Records the latency of every request by method, route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; using its
+            # template keeps session ids out of the label values
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.http_request_seconds.observe(
+                time.perf_counter() - started, scope["method"], route, str(status_code)
+            )
 
 app.add_middleware(ErrorLoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# Point-in-time state of the in-process caches and the LLM scheduler
+metrics.StatsGauges("interviewmate_llm_scheduler", "LLM scheduler", scheduler.stats)
+metrics.StatsGauges("interviewmate_llm_client_cache", "Cached InterviewMate clients", interview_mates.stats)
+metrics.StatsGauges("interviewmate_feedback_cache_l1", "In-process feedback cache", feedback_cache.local_cache.stats)
+metrics.StatsGauges("interviewmate_interview_socket", "Interview WebSocket connections", interview_socket.stats)
+metrics.StatsGauges("interviewmate_speech_pool", "Speech recognizer pool", transcription.pool.stats)
+
+@app.on_event("startup")
+async def start_speech_workers():
+    """Load the speech models before the first voice answer, when configured"""
+    await transcription.start_transcriber_pool()
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    """Release pooled Redis and LLM connections and the speech workers when the worker stops"""
+    await close_interview_mates()
+    # Buffered session writes go out before the Redis pool is closed
+    await close_session_backend()
+    await close_redis_client()
+    await transcription.close_transcriber_pool()
 
-# Setup templates and static files
-templates = Jinja2Templates(directory="templates")
+# Static files (templates are set up in templating.py)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Versioned JSON API for SPA and mobile clients
+app.include_router(api_v1.router)
+app.include_router(interview_socket.router)
+app.include_router(speech_api.router)
+
+RATE_LIMITED_MESSAGE = "The AI service is rate limiting this API key. Please wait a moment and refresh."
+
 class InterviewSetup(BaseModel):
     api_key: str
     job_topic: str
@@ -56,17 +152,12 @@ class InterviewSetup(BaseModel):
 
 # Routes
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request, session_id: Optional[str] = Cookie(None)):
+async def home(request: Request, session: Optional[RequestSession] = Depends(get_request_session)):
     """Landing page with API key authentication"""
-    try:
-        # Check if we have a valid session
-        if session_id:
-            session_data = await get_session(session_id)
-            if session_data and session_data.get("api_key"):
-                # If we have a valid session with API key, redirect to setup
-                return RedirectResponse(url="/setup", status_code=status.HTTP_303_SEE_OTHER)
-    except Exception as e:
-        print(f"Error checking session: {str(e)}")
+    # Check if we have a valid session
+    if session and session.get("api_key"):
+        # If we have a valid session with API key, redirect to setup
+        return RedirectResponse(url="/setup", status_code=status.HTTP_303_SEE_OTHER)
     
     # If no valid session or error, show login page
     return templates.TemplateResponse(
@@ -109,33 +200,28 @@ async def login(request: Request, api_key: str = Form(...)):
 @app.get("/setup", response_class=HTMLResponse)
 async def setup_page(
     request: Request,
-    session_id: str = Cookie(None)
+    session: Optional[RequestSession] = Depends(get_request_session)
 ):
     """Page to setup interview parameters"""
-    if not session_id:
-        return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
+    if not session or not session.get("api_key"):
+        # If no valid session or no API key, clear cookie and redirect to login
+        response = RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
+        response.delete_cookie(key="session_id")
+        return response
     
     try:
-        # Get session data
-        session_data = await get_session(session_id)
-        if not session_data or not session_data.get("api_key"):
-            # If no valid session or no API key, clear cookie and redirect to login
-            response = RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-            response.delete_cookie(key="session_id")
-            return response
-        
         # Check if interview is already set up
-        if session_data.get("job_topic"):
+        if session.get("job_topic"):
             # If interview is already set up, redirect to interview page
             return RedirectResponse(url="/interview", status_code=status.HTTP_303_SEE_OTHER)
         
         return templates.TemplateResponse(
             "setup.html",
-            {"request": request, "session": session_data}
+            {"request": request, "session": session.data}
         )
         
     except Exception as e:
-        print(f"Error in setup page: {str(e)}")
+        logger.error("Error in setup page: %s", e)
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
 
 @app.post("/setup")
@@ -144,24 +230,13 @@ async def process_setup(
     job_topic: str = Form(...),
     questions_per_round: int = Form(...),
     use_voice: bool = Form(False),
-    session_id: str = Cookie(None)
+    session: Optional[RequestSession] = Depends(get_request_session)
 ):
     """Process interview setup parameters"""
-    if not session_id:
+    if not session:
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
     
     try:
-        # Get session data
-        session_data = await get_session(session_id)
-        if not session_data:
-            return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-        
-        # Create session object for the controller
-        session = {
-            "session_id": session_id,
-            "api_key": session_data.get("api_key")
-        }
-        
         # Setup the interview
         await setup_interview(session, job_topic, questions_per_round, use_voice)
         return RedirectResponse(url="/interview", status_code=status.HTTP_303_SEE_OTHER)
@@ -171,7 +246,7 @@ async def process_setup(
             "setup.html",
             {
                 "request": request,
-                "session": session_data,
+                "session": session.data,
                 "error": str(e)
             }
         )
@@ -179,26 +254,25 @@ async def process_setup(
 @app.get("/interview", response_class=HTMLResponse)
 async def interview_page(
     request: Request,
-    session_id: str = Cookie(None)
+    session: Optional[RequestSession] = Depends(get_request_session)
 ):
     """Interview question and answer page"""
-    if not session_id:
-        return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-    
-    # Get session data
-    session_data = await get_session(session_id)
-    if not session_data:
+    if not session:
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
     
-    # Create session object for the controller
-    session = {
-        "session_id": session_id,
-        "api_key": session_data.get("api_key")
-    }
-    
     # Generate a question if needed
-    if not session_data.get("current_question"):
-        question = await generate_question(session)
+    if not session.get("current_question"):
+        try:
+            question = await generate_question(session)
+        except LLMRateLimited:
+            return templates.TemplateResponse(
+                "error.html",
+                {
+                    "request": request,
+                    "error": RATE_LIMITED_MESSAGE
+                },
+                status_code=429
+            )
         if not question:
             return templates.TemplateResponse(
                 "error.html",
@@ -208,47 +282,24 @@ async def interview_page(
                 }
             )
     
-    # Get the latest session data after question generation
-    session_data = await get_session(session_id)
-    
+    # The in-memory session already holds the generated question
     return templates.TemplateResponse(
         "interview.html",
-        {"request": request, "session": session_data}
+        {"request": request, "session": session.data, "server_speech": transcription.pool.enabled}
     )
 
 @app.post("/submit-answer")
 async def process_answer(
     request: Request,
     answer: str = Form(...),
-    session_id: str = Cookie(None)
+    session: Optional[RequestSession] = Depends(get_request_session)
 ):
-    """Process user's answer and generate feedback"""
-    if not session_id:
+    """Store user's answer; feedback is streamed on the feedback page"""
+    if not session:
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
     
     try:
-        # Get session data
-        session_data = await get_session(session_id)
-        if not session_data:
-            return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-        
-        # Create session object for the controller
-        session = {
-            "session_id": session_id,
-            "api_key": session_data.get("api_key")
-        }
-        
-        # Submit the answer
-        feedback = await submit_answer(session, answer)
-        if not feedback:
-            return templates.TemplateResponse(
-                "error.html",
-                {
-                    "request": request,
-                    "error": "Failed to generate feedback. Please try again."
-                }
-            )
-            
+        await store_answer(session, answer)
         return RedirectResponse(url="/feedback", status_code=status.HTTP_303_SEE_OTHER)
         
     except Exception as e:
@@ -260,47 +311,74 @@ async def process_answer(
             }
         )
 
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format a server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.get("/feedback/stream")
+async def feedback_stream(session: Optional[RequestSession] = Depends(get_request_session)):
+    """Stream feedback tokens for the submitted answer as server-sent events"""
+    if not session:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    async def event_stream():
+        # Feedback already generated, e.g. the page was refreshed
+        if session.get("feedback"):
+            yield sse_event({"token": session["feedback"]})
+            yield sse_event({}, event="done")
+            return
+        
+        if not session.get("current_question") or not session.get("current_answer"):
+            yield sse_event({"error": "No answer to evaluate."}, event="error")
+            return
+        
+        try:
+            async for chunk in stream_feedback(session):
+                yield sse_event({"token": chunk})
+            
+            # The route already flushed before streaming began, so save here
+            if not await session.flush():
+                yield sse_event({"error": FLUSH_FAILED_MESSAGE}, event="error")
+                return
+            yield sse_event({}, event="done")
+        except LLMRateLimited:
+            yield sse_event({"error": RATE_LIMITED_MESSAGE}, event="error")
+        except Exception as e:
+            logger.exception("Error streaming feedback: %s", e)
+            yield sse_event({"error": "Failed to generate feedback. Please try again."}, event="error")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/feedback", response_class=HTMLResponse)
 async def feedback_page(
     request: Request,
-    session_id: str = Cookie(None)
+    session: Optional[RequestSession] = Depends(get_request_session)
 ):
     """Page to display feedback on user's answer"""
-    if not session_id:
-        return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-    
-    # Get session data
-    session_data = await get_session(session_id)
-    if not session_data:
+    if not session:
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
     
     return templates.TemplateResponse(
         "feedback.html",
-        {"request": request, "session": session_data}
+        {"request": request, "session": session.data}
     )
 
 @app.post("/continue")
 async def process_continue(
     request: Request,
     action: str = Form(...),
-    session_id: str = Cookie(None)
+    session: Optional[RequestSession] = Depends(get_request_session)
 ):
     """Process user's decision to continue or end the interview"""
-    if not session_id:
+    if not session:
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
     
     try:
-        # Get session data
-        session_data = await get_session(session_id)
-        if not session_data:
-            return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-        
-        # Create session object for the controller
-        session = {
-            "session_id": session_id,
-            "api_key": session_data.get("api_key")
-        }
-        
         if action == "continue":
             await continue_interview(session)
             return RedirectResponse(url="/interview", status_code=status.HTTP_303_SEE_OTHER)
@@ -320,27 +398,29 @@ async def process_continue(
 @app.get("/summary", response_class=HTMLResponse)
 async def summary_page(
     request: Request,
-    session_id: str = Cookie(None)
+    session: Optional[RequestSession] = Depends(get_request_session)
 ):
     """Summary page for the interview session"""
-    if not session_id:
+    if not session:
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
     
-    # Get session data
-    session_data = await get_session(session_id)
-    if not session_data:
-        return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
+    # The only page that shows the history, so the only one that loads it
+    await session.load_history("completed_questions")
     
     return templates.TemplateResponse(
         "summary.html",
-        {"request": request, "session": session_data}
+        {
+            "request": request,
+            "session": session.data,
+            "summary_cards": render_summary_cards(session.session_id, session["completed_questions"])
+        }
     )
 
 @app.get("/logout")
 async def logout(request: Request, session_id: str = Cookie(None)):
     """End session and clear cookies"""
     if session_id:
-        await delete_session(session_id)
+        await delete_interview_session(session_id)
     
     response = RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
     response.delete_cookie(key="session_id")
@@ -351,10 +431,7 @@ async def setup_new_interview(setup_data: InterviewSetup):
     try:
         # Create a new session
         session_id = str(uuid.uuid4())
-        session = {
-            "session_id": session_id,
-            "api_key": setup_data.api_key
-        }
+        session = RequestSession(session_id, {"api_key": setup_data.api_key})
         
         # Initialize the interview
         await setup_interview(
@@ -364,82 +441,107 @@ async def setup_new_interview(setup_data: InterviewSetup):
             setup_data.use_voice
         )
         
+        if not await session.flush():
+            raise Exception("Failed to create session")
+        
         return {"session_id": session_id}
         
     except Exception as e:
-        print(f"Error in setup_new_interview: {str(e)}")
+        logger.error("Error in setup_new_interview: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/interview/{session_id}")
-async def get_interview_question(session_id: str, api_key: str):
+async def get_interview_question(
+    session_id: str,
+    api_key: str,
+    session: Optional[RequestSession] = Depends(get_path_session)
+):
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
     try:
-        # Create session object
-        session = {
-            "session_id": session_id,
-            "api_key": api_key
-        }
-        
         # Generate question
         question = await generate_question(session)
-        if not question:
-            raise HTTPException(status_code=404, detail="Could not generate question")
-            
-        return {"question": question}
-        
+    except LLMRateLimited:
+        raise HTTPException(status_code=429, detail="The AI service is rate limiting this API key. Please retry shortly.")
     except Exception as e:
-        print(f"Error in get_interview_question: {str(e)}")
+        logger.error("Error in get_interview_question: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if not question:
+        raise HTTPException(status_code=404, detail="Could not generate question")
+        
+    return {"question": question}
 
 class AnswerSubmission(BaseModel):
     answer: str
 
 @app.post("/interview/{session_id}/answer")
-async def submit_interview_answer(session_id: str, api_key: str, submission: AnswerSubmission):
+async def submit_interview_answer(
+    session_id: str,
+    api_key: str,
+    submission: AnswerSubmission,
+    session: Optional[RequestSession] = Depends(get_path_session)
+):
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
     try:
-        session = {
-            "session_id": session_id,
-            "api_key": api_key
-        }
-        
         feedback = await submit_answer(session, submission.answer)
-        if not feedback:
-            raise HTTPException(status_code=404, detail="Could not generate feedback")
-            
-        return {"feedback": feedback}
-        
+    except LLMRateLimited:
+        raise HTTPException(status_code=429, detail="The AI service is rate limiting this API key. Please retry shortly.")
     except Exception as e:
-        print(f"Error in submit_interview_answer: {str(e)}")
+        logger.error("Error in submit_interview_answer: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if not feedback:
+        raise HTTPException(status_code=404, detail="Could not generate feedback")
+        
+    return {"feedback": feedback}
 
 @app.post("/interview/{session_id}/continue")
-async def continue_to_next_question(session_id: str, api_key: str):
+async def continue_to_next_question(
+    session_id: str,
+    api_key: str,
+    session: Optional[RequestSession] = Depends(get_path_session)
+):
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
     try:
-        session = {
-            "session_id": session_id,
-            "api_key": api_key
-        }
-        
         await continue_interview(session)
         return {"status": "success"}
         
     except Exception as e:
-        print(f"Error in continue_to_next_question: {str(e)}")
+        logger.error("Error in continue_to_next_question: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/interview/{session_id}/end")
-async def end_interview_session(session_id: str, api_key: str):
+async def end_interview_session(
+    session_id: str,
+    api_key: str,
+    session: Optional[RequestSession] = Depends(get_path_session)
+):
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
     try:
-        session = {
-            "session_id": session_id,
-            "api_key": api_key
-        }
-        
         await end_interview(session)
         return {"status": "success"}
         
     except Exception as e:
-        print(f"Error in end_interview_session: {str(e)}")
+        logger.error("Error in end_interview_session: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(authorization: Optional[str] = Header(None)):
+    """Prometheus scrape endpoint for this worker, served only with Metrics_Token"""
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics.scrape_authorized(authorization):
+        raise HTTPException(status_code=401, detail="Missing or invalid metrics token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,199 @@
+import hmac
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# In-process metrics in the Prometheus text format, served from /metrics.
+# Recording is a dict lookup and a couple of additions, so it can sit on the
+# hot path; nothing is formatted until the endpoint is scraped. Each worker
+# keeps its own numbers - scrape every worker, not a load balancer.
+#
+# The endpoint is off unless Metrics_Token is set; scrapers then send it as
+# a bearer token.
+
+METRICS_TOKEN = os.getenv("Metrics_Token", "")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (128, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 262144, 1048576)
+
+_registry: List[Any] = []
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic total, e.g. Redis round trips per command"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, Tuple, Tuple, float]]:
+        for labels, value in list(self._values.items()):
+            yield self.name, self.labelnames, labels, value
+
+class Histogram:
+    """Bucketed observations with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: Any) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> Iterator[Tuple[str, Tuple, Tuple, float]]:
+        bucket_labelnames = self.labelnames + ("le",)
+        for labels, (counts, total) in list(self._values.items()):
+            counts = list(counts)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labelnames, labels + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labelnames, labels, total
+            yield f"{self.name}_count", self.labelnames, labels, cumulative
+
+class StatsGauges:
+    """Exposes the numeric values of a ``stats()`` dict as gauges at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, prefix: str, help: str, stats: Callable[[], Dict[str, Any]]):
+        self.name = prefix
+        self.help = help
+        self.labelnames = ()
+        self.stats = stats
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, value in self.stats().items():
+            if isinstance(value, (int, float)):
+                name = f"{self.name}_{key}"
+                lines += [f"# HELP {name} {self.help}: {key}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+        return lines
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        if isinstance(metric, StatsGauges):
+            lines += metric.render()
+            continue
+
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labelnames, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# HTTP
+http_request_seconds = Histogram(
+    "interviewmate_http_request_duration_seconds",
+    "Time to serve a request, by route template (streams count until they end)",
+    ("method", "route", "status")
+)
+
+# Redis
+redis_command_seconds = Histogram(
+    "interviewmate_redis_command_duration_seconds",
+    "Latency of one Redis round trip, by command (pipelines count once)",
+    ("command",)
+)
+redis_round_trips = Counter(
+    "interviewmate_redis_round_trips_total",
+    "Redis round trips, by command (pipelines count once)",
+    ("command",)
+)
+redis_errors = Counter(
+    "interviewmate_redis_errors_total",
+    "Redis calls that raised, by command",
+    ("command",)
+)
+session_payload_bytes = Histogram(
+    "interviewmate_session_payload_bytes",
+    "Encoded size of session data read from or written to Redis",
+    ("operation",),
+    buckets=SIZE_BUCKETS
+)
+
+# LLM
+llm_call_seconds = Histogram(
+    "interviewmate_llm_call_duration_seconds",
+    "Latency of one LLM call, by chain (excludes time queued in the scheduler)",
+    ("chain",)
+)
+llm_tokens = Counter(
+    "interviewmate_llm_tokens_total",
+    "Tokens reported by the provider, by chain and kind",
+    ("chain", "kind")
+)
+llm_estimated_prompt_tokens = Counter(
+    "interviewmate_llm_estimated_prompt_tokens_total",
+    "Prompt tokens estimated before the call, by chain",
+    ("chain",)
+)
+llm_errors = Counter(
+    "interviewmate_llm_errors_total",
+    "LLM calls that failed, by chain and error type",
+    ("chain", "error")
+)
+
+# Speech
+speech_chunk_seconds = Histogram(
+    "interviewmate_speech_chunk_duration_seconds",
+    "Time to recognize one audio chunk, including the wait for its worker process",
+    ("operation",)
+)
+
+@contextmanager
+def redis_call(command: str) -> Iterator[None]:
+    """Count and time one Redis round trip"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        redis_errors.inc(command)
+        raise
+    finally:
+        redis_round_trips.inc(command)
+        redis_command_seconds.observe(time.perf_counter() - started, command)
+
+def scrape_authorized(authorization: Optional[str]) -> bool:
+    """Whether an Authorization header carries the configured Metrics_Token"""
+    scheme, _, credentials = (authorization or "").partition(" ")
+    return bool(METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.strip().encode(), METRICS_TOKEN.encode()
+    )
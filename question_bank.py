@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+from typing import Iterable, List, Tuple
+from chatbot import normalize_question
+from question_similarity import QuestionIndex
+from redis_session_manager import get_redis_client
+from session_manager import uses_redis
+from ttl_cache import AsyncTTLCache
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Shared question bank: generated questions are stored per normalized topic so
+# later sessions on the same topic can be served without an LLM call.
+#
+#   question_bank:{topic}       hash of position -> question, append-only
+#   question_bank:{topic}:keys  set of question digests, for deduplication
+#
+# Sessions walk the bank from a random offset, so each draw is a couple of
+# O(1) HGETs no matter how large the bank grows. Without Redis
+# (Session_Backend=memory) the banks are kept in the process instead.
+
+QUESTION_BANK_ENABLED = os.getenv("Question_Bank_Enabled", "true").lower() == "true"
+QUESTION_BANK_MAX_SIZE = int(os.getenv("Question_Bank_Max_Size", "500"))
+QUESTION_BANK_TTL = 30 * 24 * 3600  # Topics nobody practices expire after 30 days
+QUESTION_BANK_LOCAL_TOPICS = 1000  # Topics kept in the process without Redis
+
+ADD_SCRIPT = """
+local ttl, max_size = tonumber(ARGV[1]), tonumber(ARGV[2])
+local added = 0
+for i = 3, #ARGV, 2 do
+    local size = redis.call('HLEN', KEYS[1])
+    if size >= max_size then
+        break
+    end
+    if redis.call('SADD', KEYS[2], ARGV[i]) == 1 then
+        redis.call('HSET', KEYS[1], size, ARGV[i + 1])
+        added = added + 1
+    end
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+return added
+"""
+
+DRAW_SCRIPT = """
+local size = redis.call('HLEN', KEYS[1])
+local offset, cursor, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local result = {}
+while cursor < size and #result < limit do
+    table.insert(result, redis.call('HGET', KEYS[1], tostring((offset + cursor) % size)))
+    cursor = cursor + 1
+end
+return result
+"""
+
+_scripts = {}
+
+# bank key -> (questions, digests), used when there is no Redis
+local_banks = AsyncTTLCache(max_size=QUESTION_BANK_LOCAL_TOPICS, ttl=QUESTION_BANK_TTL)
+
+def _script(name: str, source: str):
+    """Register a Lua script once per Redis client"""
+    client = get_redis_client()
+    script = _scripts.get(name)
+    if script is None or script.registered_client is not client:
+        script = client.register_script(source)
+        _scripts[name] = script
+    return script
+
+def normalize_topic(job_topic: str) -> str:
+    """Map spelling variants of a topic to one bank, e.g. ' data  Science' -> 'data science'"""
+    topic = re.sub(r"[^a-z0-9+#]+", " ", job_topic.lower())
+    return " ".join(topic.split())[:100]
+
+def _bank_key(job_topic: str) -> str:
+    return f"question_bank:{normalize_topic(job_topic)}"
+
+def _question_digest(question: str) -> str:
+    return hashlib.sha1(normalize_question(question).encode()).hexdigest()
+
+def _add_local(bank_key: str, args: List[str]) -> int:
+    """ADD_SCRIPT against the in-process bank"""
+    questions, digests = local_banks.get(bank_key) or ([], set())
+    added = 0
+    for digest, question in zip(args[::2], args[1::2]):
+        if len(questions) >= QUESTION_BANK_MAX_SIZE:
+            break
+        if digest not in digests:
+            digests.add(digest)
+            questions.append(question)
+            added += 1
+    # Storing it again restarts the TTL, like the EXPIRE in the script
+    local_banks.set(bank_key, (questions, digests))
+    return added
+
+def _draw_local(bank_key: str, offset: int, cursor: int, limit: int) -> List[str]:
+    """DRAW_SCRIPT against the in-process bank"""
+    questions, _ = local_banks.get(bank_key) or ([], set())
+    size = len(questions)
+    return [questions[(offset + position) % size] for position in range(cursor, min(size, cursor + limit))]
+
+async def add_questions(job_topic: str, questions: Iterable[str]) -> int:
+    """Add generated questions to the topic's bank, skipping ones it already has"""
+    if not QUESTION_BANK_ENABLED:
+        return 0
+
+    args = []
+    for question in questions:
+        args.extend([_question_digest(question), question])
+    if not args:
+        return 0
+
+    bank_key = _bank_key(job_topic)
+    if not uses_redis():
+        return _add_local(bank_key, args)
+
+    try:
+        script = _script("add", ADD_SCRIPT)
+        return await script(keys=[bank_key, f"{bank_key}:keys"],
+                            args=[QUESTION_BANK_TTL, QUESTION_BANK_MAX_SIZE] + args)
+    except Exception as e:
+        logger.error("Error adding to question bank: %s: %s", type(e).__name__, e)
+        return 0
+
+async def draw_questions(job_topic: str, offset: int, cursor: int, count: int,
+                         asked: QuestionIndex) -> Tuple[List[str], int]:
+    """Take up to count bank questions that are not near-duplicates of asked ones
+
+    Accepted questions are added to ``asked``. Returns the questions and the
+    advanced cursor to store in the session.
+    """
+    if not QUESTION_BANK_ENABLED or count <= 0:
+        return [], cursor
+
+    questions = []
+    bank_key = _bank_key(job_topic)
+    try:
+        script = _script("draw", DRAW_SCRIPT) if uses_redis() else None
+        while len(questions) < count:
+            # Usually one trip; another only if the window held already-asked entries
+            if script is None:
+                batch = _draw_local(bank_key, offset, cursor, count - len(questions))
+            else:
+                batch = await script(keys=[bank_key], args=[offset, cursor, count - len(questions)])
+            if not batch:
+                break
+            cursor += len(batch)
+            for question in batch:
+                if not asked.is_duplicate(question):
+                    asked.add(question)
+                    questions.append(question)
+    except Exception as e:
+        logger.error("Error drawing from question bank: %s: %s", type(e).__name__, e)
+
+    return questions, cursor
@@ -0,0 +1,97 @@
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# Offline near-duplicate detection for interview questions: each question is
+# embedded as a sparse hashed TF-IDF vector over words and their character
+# 4-grams (so "shortener" and "shortening" still overlap), and a
+# candidate is rejected when its cosine similarity to an earlier question in
+# the session reaches the threshold. No model or external service is needed.
+
+SIMILARITY_THRESHOLD = float(os.getenv("Question_Similarity_Threshold", "0.6"))
+VECTOR_DIMENSIONS = 2 ** 14
+
+STOPWORDS = frozenset("""
+a an and are as at be by can could describe do does explain for from how i if in is it its
+me of on or please should tell that the this to was we what when where which while who why
+will with would you your
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9+#]+")
+
+def _stem(word: str) -> str:
+    """Very light suffix stripping so 'models' and 'model' share a feature"""
+    for suffix in ("ing", "ies", "es", "ed", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+def tokenize(text: str) -> List[str]:
+    """Content words plus the character 4-grams of each word"""
+    words = [_stem(word) for word in _TOKEN_RE.findall(text.lower()) if word not in STOPWORDS]
+    grams = []
+    for word in words:
+        padded = f"<{word}>"
+        grams.extend(padded[i:i + 4] for i in range(max(1, len(padded) - 3)))
+    return words + grams
+
+def _bucket(token: str) -> int:
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(token.encode()) % VECTOR_DIMENSIONS
+
+class QuestionIndex:
+    """In-memory vector index of the questions asked in one session"""
+
+    def __init__(self, questions: Iterable[str] = (), threshold: Optional[float] = None):
+        self.threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+        self._documents: List[Counter] = []
+        self._document_frequency: Counter = Counter()
+        for question in questions:
+            self.add(question)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _term_counts(self, text: str) -> Counter:
+        return Counter(_bucket(token) for token in tokenize(text))
+
+    def _vector(self, counts: Counter) -> Dict[int, float]:
+        """Sublinear TF times smoothed IDF, L2-normalized"""
+        total = len(self._documents) + 1
+        vector = {
+            bucket: (1 + math.log(count)) * (math.log((total + 1) / (self._document_frequency[bucket] + 1)) + 1)
+            for bucket, count in counts.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {bucket: weight / norm for bucket, weight in vector.items()} if norm else {}
+
+    def add(self, question: str) -> None:
+        counts = self._term_counts(question)
+        self._documents.append(counts)
+        self._document_frequency.update(counts.keys())
+
+    def max_similarity(self, question: str) -> float:
+        """Highest cosine similarity between question and any indexed question"""
+        query = self._vector(self._term_counts(question))
+        if not query:
+            return 0.0
+
+        best = 0.0
+        for counts in self._documents:
+            document = self._vector(counts)
+            best = max(best, sum(weight * document.get(bucket, 0.0) for bucket, weight in query.items()))
+        return best
+
+    def is_duplicate(self, question: str) -> bool:
+        return self.max_similarity(question) >= self.threshold
+
+def covered_subtopics(questions: Iterable[str], limit: int = 15) -> List[str]:
+    """Most frequent content words across questions, as a compact topic list"""
+    counts = Counter(
+        word for question in questions for word in _TOKEN_RE.findall(question.lower())
+        if word not in STOPWORDS and len(word) > 3
+    )
+    return [word for word, _ in counts.most_common(limit)]
@@ -1,158 +1,362 @@
-import redis
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError, RedisError, ResponseError, WatchError
 import os
-import json
-from typing import Dict, Any, Optional
-import time
+from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
+import logging
+from app_logging import get_logger, Redacted
+import session_codec
+import metrics
+from ttl_cache import AsyncTTLCache
 
 load_dotenv()
 
-# Log environment variables (without sensitive data)
-print("Environment variables check:")
-print(f"Redis_Host exists: {'Redis_Host' in os.environ}")
-print(f"Redis_Port exists: {'Redis_Port' in os.environ}")
-print(f"Redis_Username exists: {'Redis_Username' in os.environ}")
-print(f"Redis_Password exists: {'Redis_Password' in os.environ}")
+logger = get_logger(__name__)
+
+# Log which settings are present (without sensitive data)
+logger.debug("Redis environment check", extra={
+    name: name in os.environ for name in ("Redis_Host", "Redis_Port", "Redis_Username", "Redis_Password")
+})
 
 REDIS_HOST = os.getenv("Redis_Host")
 REDIS_PORT = os.getenv("Redis_Port")
 REDIS_USERNAME = os.getenv("Redis_Username")
 REDIS_PASSWORD = os.getenv("Redis_Password")
 
-# Global redis client - will be initialized lazily
+# Pool sizing - requests wait for a free connection instead of opening new ones
+REDIS_MAX_CONNECTIONS = int(os.getenv("Redis_Max_Connections", "20"))
+REDIS_POOL_TIMEOUT = float(os.getenv("Redis_Pool_Timeout", "5"))
+# Idle connections are pinged before reuse only after this many seconds
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("Redis_Health_Check_Interval", "30"))
+
+SESSION_TTL = 3600  # 1 hour expiration
+
+# "hash" stores each field separately so a write touches only the changed
+# fields in one atomic round trip; "json" keeps the legacy single-blob layout
+SESSION_STORE_MODE = os.getenv("Session_Store_Mode", "hash").lower()
+
+# Growing lists live in their own Redis lists and are appended in place
+LIST_FIELDS = ("previous_questions", "completed_questions", "question_queue")
+
+# Cold history that grows with the interview. A normal read returns only the
+# hot hash and the short question queue, so its size stays constant however
+# long the session gets; history is fetched with get_session_history() by the
+# pages and steps that need it.
+HISTORY_FIELDS = ("previous_questions", "completed_questions")
+HOT_LIST_FIELDS = tuple(field for field in LIST_FIELDS if field not in HISTORY_FIELDS)
+
+# Global pool and client - will be initialized lazily
+redis_pool = None
 redis_client = None
 
-def get_redis_client():
-    """Create a Redis client with retry mechanism - lazy loading pattern"""
-    global redis_client
-    
-    # Return existing client if already initialized
+# Sessions known to be stored in the hash layout. Any other session gets its
+# key type checked before the first write: MULTI has no rollback, so the
+# list writes queued after an HSET failing on a legacy JSON string would still
+# run, and a retry after migrating would apply them twice.
+hash_layout_sessions = AsyncTTLCache(max_size=int(os.getenv("Session_Layout_Cache_Size", "10000")), ttl=SESSION_TTL)
+
+class InstrumentedPipeline(Pipeline):
+    """Pipeline whose execute() is timed as a single round trip"""
+
+    async def execute(self, raise_on_error: bool = True):
+        if not self.command_stack:
+            return await super().execute(raise_on_error)
+        with metrics.redis_call("MULTI" if self.is_transaction else "PIPELINE"):
+            return await super().execute(raise_on_error)
+
+class InstrumentedRedis(redis.Redis):
+    """Client recording latency and round trips of every command for /metrics"""
+
+    async def execute_command(self, *args, **options):
+        with metrics.redis_call(str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+def get_redis_client() -> redis.Redis:
+    """Return the shared asyncio Redis client - lazy loading pattern
+
+    No round trip happens here: connections are opened on first use and
+    health-checked by the pool, and transient connection errors are retried
+    with exponential backoff without blocking the event loop.
+    """
+    global redis_pool, redis_client
+
     if redis_client is not None:
-        try:
-            # Test if connection is still alive
-            redis_client.ping()
-            return redis_client
-        except:
-            # Reset client if connection is dead
-            redis_client = None
-    
-    max_retries = 3
-    retry_delay = 1  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"Attempting Redis connection (attempt {attempt + 1}/{max_retries})")
-            print(f"Connection details - Host: {REDIS_HOST}, Port: {REDIS_PORT}")
-            
-            # Create Redis client with explicit configuration
-            client = redis.Redis(
-                host=REDIS_HOST,
-                port=int(REDIS_PORT),
-                username=REDIS_USERNAME,
-                password=REDIS_PASSWORD,
-                decode_responses=True,
-                socket_timeout=5,
-                socket_connect_timeout=5,
-                retry_on_timeout=True,
-                ssl=True,  # Enable SSL/TLS
-                ssl_cert_reqs=None  # Don't verify SSL certificate
-            )
-            
-            # Test the connection
-            print("Testing Redis connection with ping...")
-            client.ping()
-            print("Successfully connected to Redis")
-            
-            # Store the client globally
-            global redis_client
-            redis_client = client
-            return client
-            
-        except redis.ConnectionError as e:
-            print(f"Redis connection error: {str(e)}")
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                print(f"Failed to connect to Redis after {max_retries} attempts")
-                raise
-        except Exception as e:
-            print(f"Unexpected error while connecting to Redis: {type(e).__name__}: {str(e)}")
-            raise
-
-async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
-    """Retrieve a session from Redis"""
+        return redis_client
+
+    logger.info("Creating Redis connection pool", extra={
+        "host": REDIS_HOST, "port": REDIS_PORT, "max_connections": REDIS_MAX_CONNECTIONS
+    })
+
+    redis_pool = redis.BlockingConnectionPool(
+        connection_class=redis.SSLConnection,  # Enable SSL/TLS
+        host=REDIS_HOST,
+        port=int(REDIS_PORT),
+        username=REDIS_USERNAME,
+        password=REDIS_PASSWORD,
+        decode_responses=True,
+        socket_timeout=5,
+        socket_connect_timeout=5,
+        retry_on_timeout=True,
+        retry=Retry(ExponentialBackoff(cap=2, base=0.1), retries=3),
+        retry_on_error=[ConnectionError, TimeoutError],
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        ssl_cert_reqs=None  # Don't verify SSL certificate
+    )
+    redis_client = InstrumentedRedis(connection_pool=redis_pool)
+    return redis_client
+
+async def close_redis_client() -> None:
+    """Close the shared client and disconnect every pooled connection"""
+    global redis_pool, redis_client
+
+    if redis_client is not None:
+        await redis_client.aclose()
+    if redis_pool is not None:
+        await redis_pool.disconnect()
+
+    redis_client = None
+    redis_pool = None
+
+def _session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+def _list_key(session_id: str, field: str) -> str:
+    return f"session:{session_id}:{field}"
+
+def _all_keys(session_id: str) -> List[str]:
+    return [_session_key(session_id)] + [_list_key(session_id, field) for field in LIST_FIELDS]
+
+def _is_wrong_type(error: Exception) -> bool:
+    # Errors inside a MULTI/EXEC pipeline are reworded as
+    # "Command # 1 (HSET ...) of pipeline caused error: WRONGTYPE ..."
+    return isinstance(error, ResponseError) and "WRONGTYPE" in str(error)
+
+async def _get_json_session(client, session_id: str) -> Optional[Dict[str, Any]]:
+    """Read a session stored as a single JSON document"""
+    session_data = await client.get(_session_key(session_id))
+    if not session_data:
+        return None
+    metrics.session_payload_bytes.observe(len(session_data), "read")
+    try:
+        return session_codec.decode(session_data)
+    except ValueError as e:
+        logger.error("Error decoding session data: %s", e)
+        return None
+
+async def _get_hash_session(client: redis.Redis, session_id: str, list_fields=LIST_FIELDS) -> Optional[Dict[str, Any]]:
+    """Read the session hash and the given list fields in one pipelined round trip"""
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.hgetall(_session_key(session_id))
+        for field in list_fields:
+            pipe.lrange(_list_key(session_id, field), 0, -1)
+        results = await pipe.execute(raise_on_error=False)
+
+    fields = results[0]
+    if _is_wrong_type(fields):
+        # Session was written by the legacy JSON layout
+        return await _get_json_session(client, session_id)
+    if isinstance(fields, Exception):
+        raise fields
+    # Missing keys are created as hashes too, so either way no check is needed.
+    # Only recorded once: reads are the hot path and set() reorders the cache
+    if session_id not in hash_layout_sessions:
+        hash_layout_sessions.set(session_id, True)
+    if not fields:
+        return None
+
+    size = 0
+    session = {}
+    for key, value in fields.items():
+        size += len(value)
+        session[key] = session_codec.decode(value)
+    for field, items in zip(list_fields, results[1:]):
+        size += sum(len(item) for item in items)
+        session[field] = [session_codec.decode(item) for item in items]
+    metrics.session_payload_bytes.observe(size, "read")
+    return session
+
+async def _get_history_lists(client: redis.Redis, session_id: str, fields) -> Dict[str, list]:
+    async with client.pipeline(transaction=False) as pipe:
+        for field in fields:
+            pipe.lrange(_list_key(session_id, field), 0, -1)
+        results = await pipe.execute()
+
+    metrics.session_payload_bytes.observe(sum(len(item) for items in results for item in items), "history")
+    return {field: [session_codec.decode(item) for item in items] for field, items in zip(fields, results)}
+
+def _queue_hash_write(pipe, session_id: str, updates: Dict[str, Any],
+                      appends: Optional[Dict[str, list]], pops: Optional[Dict[str, int]] = None) -> None:
+    """Queue field writes, in-place list pops/appends and TTL refresh on a pipeline"""
+    scalars = {key: session_codec.encode(value) for key, value in updates.items() if key not in LIST_FIELDS}
+    # Make sure the hash exists so the session is visible even if only lists change
+    scalars.setdefault("session_id", session_codec.encode(session_id))
+    pipe.hset(_session_key(session_id), mapping=scalars)
+    size = sum(len(value) for value in scalars.values())
+
+    for field in LIST_FIELDS:
+        list_key = _list_key(session_id, field)
+        if field in updates:
+            # Full replacement, e.g. resetting history when a new interview starts
+            pipe.delete(list_key)
+            if updates[field]:
+                items = [session_codec.encode(item) for item in updates[field]]
+                size += sum(len(item) for item in items)
+                pipe.rpush(list_key, *items)
+        if pops and pops.get(field):
+            # Drop items from the front without touching concurrent appends
+            pipe.ltrim(list_key, pops[field], -1)
+        if appends and appends.get(field):
+            items = [session_codec.encode(item) for item in appends[field]]
+            size += sum(len(item) for item in items)
+            pipe.rpush(list_key, *items)
+    metrics.session_payload_bytes.observe(size, "write")
+
+    for key in _all_keys(session_id):
+        pipe.expire(key, SESSION_TTL)
+
+async def _ensure_hash_layout(client: redis.Redis, session_id: str) -> None:
+    """Rewrite a legacy JSON session into the hash layout before writing to it"""
+    key = _session_key(session_id)
+    async with client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(key)
+                if await pipe.type(key) != "string":
+                    await pipe.unwatch()
+                    break
+                legacy = await _get_json_session(pipe, session_id) or {}
+                pipe.multi()
+                pipe.delete(key)
+                _queue_hash_write(pipe, session_id, legacy, None)
+                await pipe.execute()
+                logger.info("Migrated legacy JSON session %s to hash layout", session_id)
+                break
+            except WatchError:
+                # Another writer got there first - look at the key again
+                continue
+    hash_layout_sessions.set(session_id, True)
+
+async def get_session(session_id: str, history: bool = True) -> Optional[Dict[str, Any]]:
+    """Retrieve a session from Redis
+
+    With ``history=False`` the HISTORY_FIELDS lists are left out (legacy JSON
+    sessions are always read whole, so they may still be present).
+    """
     try:
         client = get_redis_client()
         if not client:
-            print("Error: Could not initialize Redis client")
+            logger.error("Could not initialize Redis client")
             return None
             
-        print(f"Attempting to get session with ID: {session_id}")
-        session_key = f"session:{session_id}"
-        session_data = client.get(session_key)
-        
-        if session_data:
-            try:
-                decoded_data = json.loads(session_data)
-                print(f"Retrieved session data: {decoded_data}")
-                return decoded_data
-            except json.JSONDecodeError as e:
-                print(f"Error decoding session data: {str(e)}")
-                return None
+        logger.debug("Getting session %s", session_id)
+        if SESSION_STORE_MODE == "json":
+            decoded_data = await _get_json_session(client, session_id)
+        else:
+            decoded_data = await _get_hash_session(client, session_id, LIST_FIELDS if history else HOT_LIST_FIELDS)
+
+        if decoded_data:
+            logger.debug("Retrieved session %s: %s", session_id, Redacted(decoded_data))
+            return decoded_data
         
-        print(f"No session found for ID: {session_id}")
+        logger.debug("No session found for ID: %s", session_id)
         return None
     except Exception as e:
-        print(f"Error getting session: {type(e).__name__}: {str(e)}")
+        logger.error("Error getting session: %s: %s", type(e).__name__, e)
         return None
 
-async def update_session(session_id: str, **kwargs) -> bool:
-    """Update session data in Redis"""
+async def get_session_history(session_id: str, fields=HISTORY_FIELDS) -> Dict[str, list]:
+    """Retrieve the cold history lists of a session in one round trip"""
+    try:
+        client = get_redis_client()
+        if not client:
+            logger.error("Could not initialize Redis client")
+            return {}
+
+        if SESSION_STORE_MODE == "json":
+            session = await _get_json_session(client, session_id) or {}
+            return {field: session.get(field, []) for field in fields}
+
+        # Legacy JSON sessions come back whole from get_session, so their
+        # history never needs to be fetched from the list keys
+        return await _get_history_lists(client, session_id, fields)
+    except Exception as e:
+        logger.error("Error getting session history: %s: %s", type(e).__name__, e)
+        return {}
+
+async def update_session(session_id: str, appends: Optional[Dict[str, list]] = None,
+                         pops: Optional[Dict[str, int]] = None, **kwargs) -> bool:
+    """Update session data in Redis
+
+    In hash mode only the given fields are written, ``pops`` removes that many
+    items from the front of list fields and ``appends`` pushes items onto
+    them in place, all in a single MULTI/EXEC round trip.
+    """
     try:
         client = get_redis_client()
         if not client:
-            print("Error: Could not initialize Redis client")
+            logger.error("Could not initialize Redis client")
             return False
-            
-        session_key = f"session:{session_id}"
-        
-        # Get existing session data
-        existing_data = await get_session(session_id) or {}
-        
-        # Update with new values
-        existing_data.update(kwargs)
-        
-        print(f"Updating session {session_id} with data: {existing_data}")
-        
-        # Save back to Redis with 1 hour expiration
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Updating session %s", session_id, extra={
+                "fields": list(kwargs), "appends": list(appends or {}), "pops": list(pops or {})
+            })
+
         try:
-            client.setex(
-                session_key,
-                3600,  # 1 hour expiration
-                json.dumps(existing_data)
-            )
+            if SESSION_STORE_MODE == "json":
+                await _update_json_session(client, session_id, appends, pops, kwargs)
+                return True
+
+            if session_id not in hash_layout_sessions:
+                await _ensure_hash_layout(client, session_id)
+            async with client.pipeline(transaction=True) as pipe:
+                _queue_hash_write(pipe, session_id, kwargs, appends, pops)
+                await pipe.execute()
             return True
-        except redis.RedisError as e:
-            print(f"Redis error while updating session: {str(e)}")
+        except RedisError as e:
+            logger.error("Redis error while updating session: %s", e)
             return False
             
     except Exception as e:
-        print(f"Error updating session: {type(e).__name__}: {str(e)}")
+        logger.error("Error updating session: %s: %s", type(e).__name__, e)
         return False
 
+async def _update_json_session(client: redis.Redis, session_id: str,
+                               appends: Optional[Dict[str, list]], pops: Optional[Dict[str, int]],
+                               updates: Dict[str, Any]) -> None:
+    """Legacy read-modify-write of the whole JSON document"""
+    existing_data = await _get_json_session(client, session_id) or {}
+    existing_data.update(updates)
+    for field, count in (pops or {}).items():
+        existing_data[field] = existing_data.get(field, [])[count:]
+    for field, items in (appends or {}).items():
+        existing_data[field] = existing_data.get(field, []) + list(items)
+
+    # Save back to Redis with 1 hour expiration
+    payload = session_codec.encode(existing_data)
+    metrics.session_payload_bytes.observe(len(payload), "write")
+    await client.setex(_session_key(session_id), SESSION_TTL, payload)
+
 async def delete_session(session_id: str) -> bool:
     """Delete a session from Redis"""
     try:
         client = get_redis_client()
         if not client:
-            print("Error: Could not initialize Redis client")
+            logger.error("Could not initialize Redis client")
             return False
             
-        session_key = f"session:{session_id}"
-        client.delete(session_key)
-        print(f"Successfully deleted session: {session_id}")
+        await client.delete(*_all_keys(session_id))
+        hash_layout_sessions.pop(session_id)
+        logger.info("Deleted session %s", session_id)
         return True
     except Exception as e:
-        print(f"Error deleting session: {type(e).__name__}: {str(e)}")
-        return False 
\ No newline at end of file
+        logger.error("Error deleting session: %s: %s", type(e).__name__, e)
+        return False 
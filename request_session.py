@@ -0,0 +1,204 @@
+from fastapi import Request, Cookie, Header, HTTPException, WebSocket, status
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from typing import Dict, Any, Optional, Callable
+from session_manager import HISTORY_FIELDS, get_session, get_session_history, update_session
+from templating import templates
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+FLUSH_FAILED_MESSAGE = "Your progress could not be saved. Please try again."
+
+class RequestSession:
+    """Session loaded once per request
+
+    Reads are served from the in-memory copy and writes are buffered, then
+    flushed to Redis in a single pipelined update when the response is ready.
+    History lists (HISTORY_FIELDS) are not loaded up front - call
+    ``load_history()`` before reading them.
+    """
+
+    def __init__(self, session_id: str, data: Optional[Dict[str, Any]] = None):
+        self.session_id = session_id
+        self.data = data or {}
+        self._updates: Dict[str, Any] = {}
+        self._appends: Dict[str, list] = {}
+        self._pops: Dict[str, int] = {}
+        self._history_loaded = {field for field in HISTORY_FIELDS if field in self.data}
+
+    @classmethod
+    async def load(cls, session_id: str, history: bool = False) -> Optional["RequestSession"]:
+        """Load the session from Redis, or None if it does not exist"""
+        data = await get_session(session_id, history=history)
+        if not data:
+            return None
+        return cls(session_id, data)
+
+    async def load_history(self, *fields: str) -> None:
+        """Fetch history lists on first use, keeping changes buffered so far"""
+        missing = [field for field in fields or HISTORY_FIELDS if field not in self._history_loaded]
+        if not missing:
+            return
+
+        stored = await get_session_history(self.session_id, missing)
+        for field in missing:
+            if field not in self._updates:
+                items = stored.get(field, [])[self._pops.get(field, 0):]
+                self.data[field] = items + self._appends.get(field, [])
+            self._history_loaded.add(field)
+
+    async def refresh(self) -> bool:
+        """Write buffered changes, then reload the hot fields from the store
+
+        For long-lived holders such as a WebSocket connection, to pick up
+        background writes like prefetched questions. Loaded history lists are
+        kept, since only the session's own requests change them.
+        """
+        if not await self.flush():
+            return False
+
+        data = await get_session(self.session_id, history=False)
+        if not data:
+            return False
+        for field in self._history_loaded:
+            data[field] = self.data.get(field, [])
+        self.data = data
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def update(self, **kwargs) -> None:
+        """Set fields on the in-memory copy and mark them for writing"""
+        self.data.update(kwargs)
+        self._updates.update(kwargs)
+        self._history_loaded.update(key for key in kwargs if key in HISTORY_FIELDS)
+        for key in kwargs:
+            # A full replacement supersedes pops and appends queued earlier
+            self._appends.pop(key, None)
+            self._pops.pop(key, None)
+
+    def append(self, field: str, *items) -> None:
+        """Append items to a list field without rewriting the whole list"""
+        if not items:
+            return
+        if field not in HISTORY_FIELDS or field in self._history_loaded:
+            self.data[field] = list(self.data.get(field) or []) + list(items)
+        self._appends.setdefault(field, []).extend(items)
+
+    def pop_front(self, field: str, count: int = 1) -> list:
+        """Remove and return items from the front of a stored list field"""
+        items = list(self.data.get(field) or [])
+        popped, self.data[field] = items[:count], items[count:]
+        if popped and field not in self._updates:
+            self._pops[field] = self._pops.get(field, 0) + len(popped)
+        elif popped:
+            # The list is being rewritten anyway, so write the trimmed copy
+            self._updates[field] = self.data[field]
+        return popped
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._updates or self._appends or self._pops)
+
+    async def flush(self) -> bool:
+        """Write all buffered changes in one round trip"""
+        if not self.dirty:
+            return True
+
+        success = await update_session(self.session_id, appends=self._appends, pops=self._pops, **self._updates)
+        if success:
+            self._updates = {}
+            self._appends = {}
+            self._pops = {}
+        else:
+            logger.error("Failed to flush session %s", self.session_id)
+        return success
+
+def bind_request_session(request: Request, session: Optional[RequestSession]) -> Optional[RequestSession]:
+    """Attach a session to the request so it is flushed with the response"""
+    if session is not None:
+        request.state.request_session = session
+    return session
+
+async def get_request_session(request: Request, session_id: Optional[str] = Cookie(None)) -> Optional[RequestSession]:
+    """FastAPI dependency loading the session named by the session cookie"""
+    if not session_id:
+        return None
+    return bind_request_session(request, await RequestSession.load(session_id))
+
+async def get_path_session(request: Request, session_id: str) -> Optional[RequestSession]:
+    """FastAPI dependency loading the session named in the URL path"""
+    return bind_request_session(request, await RequestSession.load(session_id))
+
+async def get_api_session(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    session_id: Optional[str] = Cookie(None)
+) -> RequestSession:
+    """FastAPI dependency for the JSON API: a bearer token or the session cookie
+
+    The token is the session id handed out when the session was created.
+    """
+    token = session_id
+    if authorization:
+        scheme, _, credentials = authorization.partition(" ")
+        if scheme.lower() == "bearer" and credentials.strip():
+            token = credentials.strip()
+
+    session = bind_request_session(request, await RequestSession.load(token)) if token else None
+    if session is None or not session.get("api_key"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing or invalid session token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return session
+
+async def get_socket_session(websocket: WebSocket) -> Optional[RequestSession]:
+    """Session for a WebSocket: the ``token`` query parameter or the session cookie
+
+    Browsers cannot set headers on a WebSocket, hence the query parameter.
+    Returns None unless the session exists and holds an API key.
+    """
+    token = websocket.query_params.get("token") or websocket.cookies.get("session_id")
+    session = await RequestSession.load(token) if token else None
+    if session is None or not session.get("api_key"):
+        return None
+    return session
+
+class SessionFlushRoute(APIRoute):
+    """Route class that flushes the request's session before the response is sent
+
+    If the flush fails, the response is replaced with a 503 - the client must
+    not be told a change was made that the session store does not have.
+    """
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            response = await original_route_handler(request)
+            session = getattr(request.state, "request_session", None)
+            if session is None or await session.flush():
+                return response
+
+            headers = {"Retry-After": "1"}
+            if request.url.path.startswith("/api/"):
+                return JSONResponse({"detail": FLUSH_FAILED_MESSAGE},
+                                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers=headers)
+            return templates.TemplateResponse(
+                "error.html",
+                {"request": request, "error": FLUSH_FAILED_MESSAGE},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers=headers
+            )
+
+        return route_handler
@@ -0,0 +1,136 @@
+import base64
+import json
+import os
+import zlib
+from typing import Any
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Encoding of the values stored for a session (hash fields, list items and
+# legacy JSON blobs). Small values stay plain JSON. Values whose size in the
+# configured format reaches the threshold - mostly completed_questions entries
+# with their multi-paragraph feedback - are written in that format, compressed
+# and tagged:
+#
+#   ~1<format><compression><base64 payload>    e.g. "~1jz..." = JSON + zlib
+#
+# JSON text never starts with "~", so untagged values (everything written
+# before this module existed) still load as plain JSON.
+
+SESSION_CODEC = os.getenv("Session_Codec", "json").lower()  # json | msgpack
+SESSION_COMPRESSION = os.getenv("Session_Compression", "zlib").lower()  # zlib | zstd | none
+SESSION_COMPRESS_THRESHOLD = int(os.getenv("Session_Compress_Threshold", "1024"))  # bytes
+
+FORMAT_VERSION = "1"
+TAG_PREFIX = "~"
+
+# orjson is optional; it is several times faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps_json(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+def loads_json(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _dumps_msgpack(value: Any) -> bytes:
+    import msgpack
+    return msgpack.packb(value, use_bin_type=True)
+
+def _loads_msgpack(data: bytes) -> Any:
+    import msgpack
+    return msgpack.unpackb(data, raw=False)
+
+def _zstd_compress(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+def _zstd_decompress(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
+
+FORMATS = {
+    "json": ("j", dumps_json, loads_json),
+    "msgpack": ("m", _dumps_msgpack, _loads_msgpack),
+}
+
+COMPRESSIONS = {
+    "none": ("-", lambda data: data, lambda data: data),
+    "zlib": ("z", lambda data: zlib.compress(data, 6), zlib.decompress),
+    "zstd": ("s", _zstd_compress, _zstd_decompress),
+}
+
+_FORMATS_BY_TAG = {tag: loads for tag, _, loads in FORMATS.values()}
+_DECOMPRESSORS_BY_TAG = {tag: decompress for tag, _, decompress in COMPRESSIONS.values()}
+
+class SessionCodec:
+    """Encodes session values to strings for Redis and decodes any known version"""
+
+    def __init__(self, format: str = "json", compression: str = "zlib", threshold: int = 1024):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown session codec format: {format}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown session compression: {compression}")
+        self.format = format
+        self.compression = compression
+        self.threshold = threshold
+        self._format_tag, self._dumps, _ = FORMATS[format]
+        self._compression_tag, self._compress, _ = COMPRESSIONS[compression]
+
+    def encode(self, value: Any) -> str:
+        # Serialize once in the configured format; the threshold applies to that size
+        raw = self._dumps(value)
+        if self.format == "json":
+            if len(raw) < self.threshold or self.compression == "none":
+                return raw.decode()
+        elif len(raw) < self.threshold:
+            # Small values stay plain JSON; only these are serialized twice
+            return dumps_json(value).decode()
+
+        payload = self._compress(raw)
+        tag = f"{TAG_PREFIX}{FORMAT_VERSION}{self._format_tag}{self._compression_tag}"
+        return tag + base64.b64encode(payload).decode("ascii")
+
+    def decode(self, data: str) -> Any:
+        if not data.startswith(TAG_PREFIX):
+            return loads_json(data)
+
+        version, format_tag, compression_tag = data[1:2], data[2:3], data[3:4]
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported session value version: {version!r}")
+        try:
+            payload = _DECOMPRESSORS_BY_TAG[compression_tag](base64.b64decode(data[4:]))
+            return _FORMATS_BY_TAG[format_tag](payload)
+        except ImportError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Corrupt session value: {type(e).__name__}: {e}") from e
+
+def _configured_codec() -> SessionCodec:
+    try:
+        codec = SessionCodec(SESSION_CODEC, SESSION_COMPRESSION, SESSION_COMPRESS_THRESHOLD)
+        # Fail at startup rather than on the first large session
+        codec._compress(codec._dumps({}))
+        return codec
+    except (ImportError, ValueError) as e:
+        logger.warning("Session codec %s/%s unavailable (%s), using json/zlib",
+                       SESSION_CODEC, SESSION_COMPRESSION, e)
+        return SessionCodec("json", "zlib", SESSION_COMPRESS_THRESHOLD)
+
+codec = _configured_codec()
+
+def encode(value: Any) -> str:
+    """Encode one session value with the configured codec"""
+    return codec.encode(value)
+
+def decode(data: str) -> Any:
+    """Decode a session value written by any codec, including legacy plain JSON"""
+    return codec.decode(data)
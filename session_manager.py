@@ -1,62 +1,386 @@
-# from typing import Dict, Optional
-# from fastapi import Cookie, HTTPException, Request, Depends
-# import asyncio
-
-# # In-memory session storage
-# # In production, use Redis or another session store
-# sessions: Dict[str, dict] = {}
-
-# async def get_session_by_id(session_id: str) -> Optional[dict]:
-#     """Get session data for the given session ID"""
-#     session = sessions.get(session_id)
-#     if not session:
-#         return None
-#     return session
-
-# async def get_session(session_id: Optional[str] = Cookie(None)):
-#     """FastAPI dependency to get session from cookie"""
-#     if not session_id:
-#         raise HTTPException(status_code=401, detail="Not authenticated")
-    
-#     session = sessions.get(session_id)
-#     if not session:
-#         raise HTTPException(status_code=401, detail="Invalid session")
-    
-#     return session
-
-# async def create_session(session_id: str, api_key: str) -> dict:
-#     """Create a new session with the given API key"""
-#     # Validate API key if needed
-#     # For simplicity, we're just storing it, but you could test it against the chatbot here
-    
-#     session = {
-#         "session_id": session_id,  # Add session_id to the session data
-#         "api_key": api_key,
-#         "job_topic": None,
-#         "use_voice": False,
-#         "questions_per_round": 3,
-#         "question_number": 1,
-#         "previous_questions": [],
-#         "current_question": None,
-#         "current_answer": None,
-#         "feedback": None,
-#         "completed_questions": []  # Store question-answer-feedback triplets
-#     }
-    
-#     sessions[session_id] = session
-#     return session
-
-# async def update_session(session_id: str, **kwargs) -> dict:
-#     """Update session with the given key-value pairs"""
-#     if session_id not in sessions:
-#         raise KeyError(f"Session {session_id} not found")
-    
-#     for key, value in kwargs.items():
-#         sessions[session_id][key] = value
-    
-#     return sessions[session_id]
-
-# async def delete_session(session_id: str) -> None:
-#     """Delete the session with the given ID"""
-#     if session_id in sessions:
-#         del sessions[session_id]
+import abc
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import redis_session_manager
+from redis_session_manager import HISTORY_FIELDS, LIST_FIELDS, SESSION_TTL, get_redis_client
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Session storage behind one interface, selected with Session_Backend:
+#
+#   redis   - every read and write goes to Redis (the default)
+#   memory  - sessions live in this process only, for single-worker deployments
+#   tiered  - a local copy in front of Redis: reads are served locally, writes
+#             are applied locally and sent to Redis shortly afterwards
+#             (write-behind), and other workers drop their copy when told a
+#             session changed. Meant for a single node or sticky sessions;
+#             writes still pending when a worker dies are lost.
+
+SESSION_BACKEND = os.getenv("Session_Backend", "redis").lower()
+SESSION_LOCAL_MAX_SESSIONS = int(os.getenv("Session_Local_Max_Sessions", "10000"))
+SESSION_WRITE_BEHIND_DELAY = float(os.getenv("Session_Write_Behind_Delay", "0.5"))  # seconds
+
+INVALIDATION_CHANNEL = "session:invalidate"
+
+def _snapshot(data: Dict[str, Any], history: bool = True) -> Dict[str, Any]:
+    """Copy handed to callers, so their changes only land through update_session"""
+    return {
+        key: list(value) if isinstance(value, list) else value
+        for key, value in data.items()
+        if history or key not in HISTORY_FIELDS
+    }
+
+def _apply(data: Dict[str, Any], updates: Dict[str, Any], appends: Dict[str, list], pops: Dict[str, int]) -> None:
+    """Apply an update in the same order as Redis: replace, pop, then append
+
+    List fields absent from ``data`` (history that was never loaded) are left
+    alone rather than filled with a partial list.
+    """
+    for key, value in updates.items():
+        data[key] = list(value) if isinstance(value, list) else value
+    for field, count in pops.items():
+        if field in data:
+            del data[field][:count]
+    for field, items in appends.items():
+        if field in data:
+            data[field].extend(items)
+
+class _LocalStore:
+    """Sessions kept in this process with a TTL refreshed on every write
+
+    Unlike AsyncTTLCache, entries stay in write order, which is also expiry
+    order, so expiring and evicting only ever looks at the oldest entries.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[session_id]
+            return None
+        return entry[1]
+
+    def put(self, session_id: str, data: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        self._entries[session_id] = (now + self.ttl, data)
+        self._entries.move_to_end(session_id)
+
+        while self._entries:
+            oldest_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_size:
+                break
+            del self._entries[oldest_id]
+
+    def pop(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
+
+class SessionBackend(abc.ABC):
+    """Interface every session store implements"""
+
+    @abc.abstractmethod
+    async def get_session(self, session_id: str, history: bool = True) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    async def get_session_history(self, session_id: str, fields=HISTORY_FIELDS) -> Dict[str, list]:
+        ...
+
+    @abc.abstractmethod
+    async def update_session(self, session_id: str, appends: Optional[Dict[str, list]] = None,
+                             pops: Optional[Dict[str, int]] = None, **kwargs) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def delete_session(self, session_id: str) -> bool:
+        ...
+
+    async def close(self) -> None:
+        """Write anything still buffered and stop background work"""
+
+class RedisSessionBackend(SessionBackend):
+    async def get_session(self, session_id, history=True):
+        return await redis_session_manager.get_session(session_id, history=history)
+
+    async def get_session_history(self, session_id, fields=HISTORY_FIELDS):
+        return await redis_session_manager.get_session_history(session_id, fields)
+
+    async def update_session(self, session_id, appends=None, pops=None, **kwargs):
+        return await redis_session_manager.update_session(session_id, appends=appends, pops=pops, **kwargs)
+
+    async def delete_session(self, session_id):
+        return await redis_session_manager.delete_session(session_id)
+
+class MemorySessionBackend(SessionBackend):
+    def __init__(self, max_sessions: int = SESSION_LOCAL_MAX_SESSIONS, ttl: float = SESSION_TTL):
+        self.store = _LocalStore(max_sessions, ttl)
+
+    async def get_session(self, session_id, history=True):
+        data = self.store.get(session_id)
+        return _snapshot(data, history) if data is not None else None
+
+    async def get_session_history(self, session_id, fields=HISTORY_FIELDS):
+        data = self.store.get(session_id) or {}
+        return {field: list(data.get(field, [])) for field in fields}
+
+    async def update_session(self, session_id, appends=None, pops=None, **kwargs):
+        data = self.store.get(session_id)
+        if data is None:
+            data = {"session_id": session_id, **{field: [] for field in LIST_FIELDS}}
+        _apply(data, kwargs, appends or {}, pops or {})
+        self.store.put(session_id, data)
+        return True
+
+    async def delete_session(self, session_id):
+        self.store.pop(session_id)
+        return True
+
+def _merge_pending(pending: Dict[str, dict], updates: Dict[str, Any],
+                   appends: Dict[str, list], pops: Dict[str, int]) -> bool:
+    """Fold a later update into a pending one if the combined write is exact
+
+    A pop after items were appended to a list cannot be merged without knowing
+    the list's length, so it stays a separate write.
+    """
+    for field, count in pops.items():
+        if count and field not in updates and field not in pending["updates"] and pending["appends"].get(field):
+            return False
+
+    for key, value in updates.items():
+        pending["updates"][key] = list(value) if isinstance(value, list) else value
+        pending["appends"].pop(key, None)
+        pending["pops"].pop(key, None)
+    for field, count in pops.items():
+        if not count:
+            continue
+        if field in updates:
+            pending["pops"][field] = count
+        elif field in pending["updates"]:
+            # The list is rewritten anyway - write the trimmed result
+            current = pending["updates"][field][pending["pops"].pop(field, 0):] + pending["appends"].pop(field, [])
+            pending["updates"][field] = current[count:]
+        else:
+            pending["pops"][field] = pending["pops"].get(field, 0) + count
+    for field, items in appends.items():
+        pending["appends"][field] = pending["appends"].get(field, []) + list(items)
+    return True
+
+class TieredSessionBackend(SessionBackend):
+    def __init__(self, remote: SessionBackend, max_sessions: int = SESSION_LOCAL_MAX_SESSIONS,
+                 ttl: float = SESSION_TTL, delay: float = SESSION_WRITE_BEHIND_DELAY):
+        self.remote = remote
+        self.local = _LocalStore(max_sessions, ttl)
+        self.delay = delay
+        self.node_id = uuid.uuid4().hex
+        # Writes not yet sent to Redis, oldest first, by session_id
+        self._pending: Dict[str, List[dict]] = {}
+        # Sessions whose writes are being sent right now
+        self._flushing: Dict[str, asyncio.Future] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _ensure_listener(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    def _settled(self, session_id: str) -> bool:
+        """True when Redis holds every write made to this session"""
+        return session_id not in self._pending and session_id not in self._flushing
+
+    async def get_session(self, session_id, history=True):
+        self._ensure_listener()
+        data = self.local.get(session_id)
+        if data is None:
+            # Anything buffered for this session must land before reading it back
+            await self.flush(session_id)
+            data = await self.remote.get_session(session_id, history=history)
+            if data is not None and self._settled(session_id):
+                self.local.put(session_id, _snapshot(data))
+            return data
+
+        missing = [field for field in HISTORY_FIELDS if field not in data]
+        if history and missing:
+            return {**_snapshot(data), **await self.get_session_history(session_id, missing)}
+        return _snapshot(data, history)
+
+    async def get_session_history(self, session_id, fields=HISTORY_FIELDS):
+        data = self.local.get(session_id)
+        if data is not None and all(field in data for field in fields):
+            return {field: list(data[field]) for field in fields}
+
+        await self.flush(session_id)
+        history = await self.remote.get_session_history(session_id, fields)
+        data = self.local.get(session_id)
+        if data is not None and history and self._settled(session_id):
+            for field, items in history.items():
+                data.setdefault(field, list(items))
+        return history
+
+    async def update_session(self, session_id, appends=None, pops=None, **kwargs):
+        appends, pops = appends or {}, pops or {}
+        data = self.local.get(session_id)
+        if data is not None:
+            _apply(data, kwargs, appends, pops)
+            self.local.put(session_id, data)
+
+        queue = self._pending.setdefault(session_id, [])
+        if not queue or not _merge_pending(queue[-1], kwargs, appends, pops):
+            queue.append({"updates": dict(kwargs), "appends": dict(appends), "pops": dict(pops)})
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_later())
+        return True
+
+    async def delete_session(self, session_id):
+        # A write already on its way to Redis would recreate the session after
+        # the delete, so let it land first; then drop whatever is still queued
+        while session_id in self._flushing:
+            await asyncio.shield(self._flushing[session_id])
+        self.local.pop(session_id)
+        self._pending.pop(session_id, None)
+        deleted = await self.remote.delete_session(session_id)
+        await self._publish_invalidation(session_id)
+        return deleted
+
+    async def _flush_later(self) -> None:
+        """Write-behind loop: runs while there is anything left to send"""
+        while True:
+            await asyncio.sleep(self.delay)
+            await self.flush_all()
+            # Writes that failed or arrived during the flush go out next round
+            if not self._pending:
+                return
+
+    async def flush_all(self) -> None:
+        await asyncio.gather(*(self.flush(session_id) for session_id in list(self._pending)))
+
+    async def flush(self, session_id: str) -> None:
+        """Send this session's buffered writes to Redis, in order"""
+        while session_id in self._flushing:
+            await asyncio.shield(self._flushing[session_id])
+        writes = self._pending.pop(session_id, None)
+        if not writes:
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        self._flushing[session_id] = done
+        try:
+            for position, write in enumerate(writes):
+                sending = asyncio.ensure_future(self.remote.update_session(
+                    session_id, appends=write["appends"], pops=write["pops"], **write["updates"]
+                ))
+                try:
+                    saved = await asyncio.shield(sending)
+                except asyncio.CancelledError:
+                    # Stopped mid-flush, e.g. by close(): the write already sent
+                    # finishes, so it is neither lost nor applied twice, and the
+                    # rest go back to the queue
+                    try:
+                        saved = await sending
+                    except (asyncio.CancelledError, Exception):
+                        saved = False
+                    self._requeue(session_id, writes[position + 1 if saved else position:])
+                    raise
+                if not saved:
+                    self._requeue(session_id, writes[position:])
+                    logger.error("Write-behind of session %s failed, will retry", session_id)
+                    return
+            await self._publish_invalidation(session_id)
+        finally:
+            del self._flushing[session_id]
+            done.set_result(None)
+
+    def _requeue(self, session_id: str, writes: List[dict]) -> None:
+        """Put unsent writes back, ahead of anything queued meanwhile"""
+        if writes:
+            self._pending[session_id] = writes + self._pending.get(session_id, [])
+
+    async def _publish_invalidation(self, session_id: str) -> None:
+        try:
+            await get_redis_client().publish(INVALIDATION_CHANNEL, f"{self.node_id}:{session_id}")
+        except Exception as e:
+            logger.error("Error publishing session invalidation: %s: %s", type(e).__name__, e)
+
+    async def _listen(self) -> None:
+        """Drop local copies of sessions that another worker changed"""
+        while True:
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                try:
+                    async for message in pubsub.listen():
+                        node_id, _, session_id = message["data"].partition(":")
+                        if node_id != self.node_id:
+                            self.local.pop(session_id)
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Changes may have been missed while disconnected, so start over
+                logger.error("Session invalidation listener failed: %s: %s", type(e).__name__, e)
+                self.local = _LocalStore(self.local.max_size, self.local.ttl)
+                await asyncio.sleep(1)
+
+    async def close(self):
+        tasks = [task for task in (self._flusher, self._listener) if task is not None]
+        for task in tasks:
+            task.cancel()
+        # A flush interrupted by the cancel requeues its writes once it stops
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.flush_all()
+        if self._pending:
+            logger.error("Dropping unsaved writes for %d sessions at shutdown", len(self._pending))
+
+def create_backend(name: str = SESSION_BACKEND) -> SessionBackend:
+    if name == "memory":
+        return MemorySessionBackend()
+    if name == "tiered":
+        return TieredSessionBackend(RedisSessionBackend())
+    if name != "redis":
+        logger.warning("Unknown Session_Backend %s, using redis", name)
+    return RedisSessionBackend()
+
+backend = create_backend()
+
+def uses_redis() -> bool:
+    """Whether this deployment has Redis, for helpers that share state through it
+
+    The memory backend runs without Redis, so the question bank, the feedback
+    cache and single-flight keep their state in the process instead.
+    """
+    return not isinstance(backend, MemorySessionBackend)
+
+async def get_session(session_id: str, history: bool = True) -> Optional[Dict[str, Any]]:
+    """Retrieve a session from the configured backend"""
+    return await backend.get_session(session_id, history=history)
+
+async def get_session_history(session_id: str, fields=HISTORY_FIELDS) -> Dict[str, list]:
+    """Retrieve the cold history lists of a session"""
+    return await backend.get_session_history(session_id, fields)
+
+async def update_session(session_id: str, appends: Optional[Dict[str, list]] = None,
+                         pops: Optional[Dict[str, int]] = None, **kwargs) -> bool:
+    """Update session fields, popping from and appending to list fields"""
+    return await backend.update_session(session_id, appends=appends, pops=pops, **kwargs)
+
+async def delete_session(session_id: str) -> bool:
+    """Delete a session"""
+    return await backend.delete_session(session_id)
+
+async def close_session_backend() -> None:
+    """Flush buffered session writes before the worker stops"""
+    await backend.close()
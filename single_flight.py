@@ -0,0 +1,202 @@
+import asyncio
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from redis_session_manager import get_redis_client
+from session_manager import uses_redis
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Single-flight coordination: concurrent duplicate requests for the same
+# session and action (a double-clicked submit, a reload while a question is
+# still being generated) share one in-flight result instead of each starting
+# their own LLM call. Callers in this process wait on a local future; callers
+# in other workers see the Redis lock and poll for the leader's result.
+# Without Redis (Session_Backend=memory) only the local futures are used.
+
+FLIGHT_LOCK_TTL_MS = 120_000  # A crashed leader cannot block a key for longer
+FLIGHT_RESULT_TTL = 60  # seconds
+# Followers poll every FLIGHT_POLL_INTERVAL, so a result outlives its lock by
+# a few polls and is then dropped
+FLIGHT_RESULT_GRACE_MS = 1000
+FLIGHT_POLL_INTERVAL = 0.1  # seconds
+FLIGHT_WAIT_TIMEOUT = 120  # seconds
+FLIGHT_ATTEMPTS = 2  # Times a follower waits for someone else before running itself
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[2], tonumber(ARGV[2]))
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class FlightAbandoned(Exception):
+    """The leader finished without publishing a result"""
+
+# In-process leaders by key
+_local: Dict[str, asyncio.Future] = {}
+
+_release_script = None
+
+# The hash tag keeps a flight's lock and result in one Redis Cluster slot
+def _lock_key(key: str) -> str:
+    return f"flight:{{{key}}}:lock"
+
+def _result_key(key: str) -> str:
+    return f"flight:{{{key}}}:result"
+
+def in_flight(key: str) -> bool:
+    """Whether a leader in this process is currently running the action for key"""
+    return key in _local
+
+class Flight:
+    """Async context manager deciding whether this caller runs the action
+
+    Inside the block, ``leader`` is True when this caller must do the work
+    and store it in ``result``; otherwise ``result`` already holds the value
+    produced by the concurrent leader.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.leader = False
+        self.result: Any = None
+        self._token: Optional[str] = None
+        self._future: Optional[asyncio.Future] = None
+
+    async def __aenter__(self) -> "Flight":
+        for _ in range(FLIGHT_ATTEMPTS):
+            existing = _local.get(self.key)
+            if existing is not None:
+                try:
+                    self.result = await asyncio.shield(existing)
+                    return self
+                except FlightAbandoned:
+                    continue
+
+            self._future = asyncio.get_running_loop().create_future()
+            _local[self.key] = self._future
+            if not uses_redis():
+                # A single worker: nobody else can be running it
+                self.leader = True
+                return self
+
+            token = uuid.uuid4().hex
+            remote_token = await self._acquire(token)
+            if remote_token is None:
+                self.leader = True
+                self._token = token
+                return self
+
+            try:
+                self.result = await self._wait_remote(remote_token)
+                self._resolve(self.result)
+                return self
+            except FlightAbandoned:
+                self._resolve(FlightAbandoned())
+                continue
+
+        # Nobody produced a result - do the work here rather than fail the request
+        self._future = None
+        self.leader = True
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if not self.leader:
+            return
+
+        try:
+            if exc_type is None and self.result is not None and self._token:
+                await self._publish()
+        finally:
+            await self._release()
+            self._resolve(self.result if exc_type is None and self.result is not None else FlightAbandoned())
+
+    def _resolve(self, outcome: Any) -> None:
+        """Hand the outcome to local followers and stop tracking this flight"""
+        future = self._future
+        if future is None:
+            return
+        if _local.get(self.key) is future:
+            del _local[self.key]
+        if not future.done():
+            if isinstance(outcome, BaseException):
+                future.set_exception(outcome)
+                # Nobody may be waiting; avoid "exception never retrieved" warnings
+                future.exception()
+            else:
+                future.set_result(outcome)
+        self._future = None
+
+    async def _acquire(self, token: str) -> Optional[str]:
+        """Take the cross-worker lock; returns the holder's token if someone else has it"""
+        try:
+            client = get_redis_client()
+            if await client.set(_lock_key(self.key), token, nx=True, px=FLIGHT_LOCK_TTL_MS):
+                return None
+            holder = await client.get(_lock_key(self.key))
+            # The holder may have released in between - then the lock is ours to retry
+            if holder is None and await client.set(_lock_key(self.key), token, nx=True, px=FLIGHT_LOCK_TTL_MS):
+                return None
+            return holder or uuid.uuid4().hex
+        except Exception as e:
+            # Without Redis only local deduplication is possible
+            logger.error("Error acquiring flight lock: %s: %s", type(e).__name__, e)
+            return None
+
+    async def _wait_remote(self, token: str) -> Any:
+        """Poll for the result published by the leader holding ``token``"""
+        client = get_redis_client()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + FLIGHT_WAIT_TIMEOUT
+        while loop.time() < deadline:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.get(_result_key(self.key))
+                pipe.get(_lock_key(self.key))
+                published, holder = await pipe.execute()
+
+            if published is not None:
+                entry = json.loads(published)
+                # Ignore results left over from an earlier flight on the same key
+                if entry["token"] == token:
+                    return entry["result"]
+            if holder != token:
+                raise FlightAbandoned()
+            await asyncio.sleep(FLIGHT_POLL_INTERVAL)
+        raise FlightAbandoned()
+
+    async def _publish(self) -> None:
+        try:
+            await get_redis_client().set(
+                _result_key(self.key),
+                json.dumps({"token": self._token, "result": self.result}),
+                ex=FLIGHT_RESULT_TTL
+            )
+        except Exception as e:
+            logger.error("Error publishing flight result: %s: %s", type(e).__name__, e)
+
+    async def _release(self) -> None:
+        global _release_script
+
+        if not self._token:
+            return
+        try:
+            client = get_redis_client()
+            if _release_script is None or _release_script.registered_client is not client:
+                _release_script = client.register_script(RELEASE_SCRIPT)
+            await _release_script(keys=[_lock_key(self.key), _result_key(self.key)],
+                                  args=[self._token, FLIGHT_RESULT_GRACE_MS])
+        except Exception as e:
+            logger.error("Error releasing flight lock: %s: %s", type(e).__name__, e)
+
+async def run_once(key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """Run func for key unless an identical call is in flight
+
+    Returns the result and whether it was shared from another caller.
+    """
+    async with Flight(key) as flight:
+        if flight.leader:
+            flight.result = await func()
+        return flight.result, not flight.leader
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+from typing import Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from request_session import RequestSession, get_api_session, get_socket_session
+from transcription import TranscriptionError, TranscriptionUnavailable, parse_wav_header, pool
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Answer audio from the browser, transcribed by the offline recognizer pool
+# in transcription.py.
+#
+# The WebSocket is the live path: the client streams raw PCM frames while
+# the user speaks and gets a partial transcript back for each one. The POST
+# endpoint takes a whole recording, but feeds the recognizer while the body
+# is still arriving, so the transcript is ready right after the upload ends.
+# Each session transcribes one answer at a time.
+
+router = APIRouter(prefix="/api/v1")
+
+DEFAULT_SAMPLE_RATE = 16000
+
+# Seconds without a frame before a live stream is closed and its slot freed
+IDLE_TIMEOUT = float(os.getenv("Speech_Socket_Idle_Timeout", "30"))
+
+# Close codes: 1013 asks the client to try again later
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_IDLE = 4408
+CLOSE_SESSION_BUSY = 4409
+CLOSE_TRY_AGAIN_LATER = 1013
+
+SESSION_BUSY_DETAIL = "Another answer is already being transcribed for this session"
+
+# Sessions with a transcription in progress
+active_sessions: Set[str] = set()
+
+WAV_CONTENT_TYPES = ("audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave")
+
+@router.post("/speech/transcribe")
+async def transcribe_upload(
+    request: Request,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    session: RequestSession = Depends(get_api_session)
+):
+    """Transcribe a recorded answer
+
+    The body is a 16-bit mono PCM WAV file, or raw PCM samples at
+    ``sample_rate`` with any other content type.
+    """
+    if session.session_id in active_sessions:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=SESSION_BUSY_DETAIL)
+
+    chunks = request.stream()
+    audio = b""
+    active_sessions.add(session.session_id)
+    try:
+        if request.headers.get("content-type", "").split(";")[0].strip() in WAV_CONTENT_TYPES:
+            header = None
+            async for chunk in chunks:
+                audio += chunk
+                header = parse_wav_header(audio)
+                if header:
+                    break
+            if header is None:
+                raise TranscriptionError("Incomplete WAV file")
+            sample_rate, offset = header
+            audio = audio[offset:]
+
+        async with pool.stream(sample_rate) as transcription:
+            if audio:
+                await transcription.feed(audio)
+            async for chunk in chunks:
+                if chunk:
+                    await transcription.feed(chunk)
+            transcript = await transcription.finish()
+    except TranscriptionUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "5"})
+    except TranscriptionError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    finally:
+        active_sessions.discard(session.session_id)
+
+    return {
+        "transcript": transcript,
+        "segments": transcription.segments,
+        "seconds": round(transcription.audio_bytes / (2 * sample_rate), 2)
+    }
+
+async def _send(websocket: WebSocket, message: dict) -> bool:
+    try:
+        await websocket.send_json(message)
+        return True
+    except Exception:
+        return False
+
+def _is_end(text: str) -> bool:
+    try:
+        return json.loads(text) == {"type": "end"}
+    except ValueError:
+        return False
+
+@router.websocket("/speech/ws")
+async def speech_socket(websocket: WebSocket, sample_rate: int = DEFAULT_SAMPLE_RATE):
+    """Live transcription: binary PCM frames in, partial transcripts out
+
+    Send {"type": "end"} after the last frame to get the full transcript.
+    """
+    await websocket.accept()
+    session = await get_socket_session(websocket)
+    if session is None:
+        await websocket.close(code=CLOSE_UNAUTHORIZED)
+        return
+    if session.session_id in active_sessions:
+        await _send(websocket, {"type": "error", "error": SESSION_BUSY_DETAIL})
+        await websocket.close(code=CLOSE_SESSION_BUSY)
+        return
+
+    close_code = 1000
+    active_sessions.add(session.session_id)
+    try:
+        async with pool.stream(sample_rate) as transcription:
+            await _send(websocket, {"type": "ready"})
+            last_text: Optional[str] = None
+            while True:
+                try:
+                    message = await asyncio.wait_for(websocket.receive(), timeout=IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    await _send(websocket, {"type": "error", "error": "No audio received, recording stopped"})
+                    close_code = CLOSE_IDLE
+                    break
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes"):
+                    result = await transcription.feed(message["bytes"])
+                    # Silence keeps returning the same partial - skip repeats
+                    if result["type"] == "final" or result["text"] != last_text:
+                        last_text = result["text"]
+                        if not await _send(websocket, result):
+                            return
+                elif message.get("text") is not None:
+                    if not _is_end(message["text"]):
+                        await _send(websocket, {"type": "error", "error": 'Unknown message, expected {"type": "end"}'})
+                        continue
+                    transcript = await transcription.finish()
+                    await _send(websocket, {"type": "done", "transcript": transcript})
+                    break
+    except WebSocketDisconnect:
+        return
+    except TranscriptionUnavailable as e:
+        await _send(websocket, {"type": "error", "error": str(e)})
+        close_code = CLOSE_TRY_AGAIN_LATER
+    except TranscriptionError as e:
+        await _send(websocket, {"type": "error", "error": str(e)})
+        close_code = 1011
+    except Exception as e:
+        logger.exception("Error in speech socket: %s", e)
+        close_code = 1011
+    finally:
+        active_sessions.discard(session.session_id)
+
+    try:
+        await websocket.close(code=close_code)
+    except Exception:
+        # The client already closed the connection
+        pass
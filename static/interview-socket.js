@@ -0,0 +1,135 @@
+// interview-socket.js - Runs voice interviews over one WebSocket instead of page loads
+
+document.addEventListener('DOMContentLoaded', () => {
+    // Elements
+    const form = document.getElementById('answerForm');
+    const answerTextarea = document.getElementById('answer');
+    const questionElement = document.querySelector('.interview-question h5');
+    const questionNumber = document.getElementById('questionNumber');
+    const feedbackCard = document.getElementById('socketFeedback');
+    const feedbackContent = feedbackCard.querySelector('.feedback-content');
+    const continueForm = document.getElementById('continueForm');
+    const nextButton = continueForm.querySelector('button[value="continue"]');
+
+    if (!window.WebSocket || !form) {
+        return;
+    }
+
+    // Close codes after which reconnecting cannot help
+    const FINAL_CLOSE_CODES = [1000, 4401, 4404, 4408, 4409];
+    const url = `${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/api/v1/interview/ws`;
+
+    let socket = null;
+    let retryDelay = 500;
+    // An answer sent but not yet evaluated, resent after a reconnect
+    let pendingAnswer = null;
+
+    function send(message) {
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify(message));
+            return true;
+        }
+        return false;
+    }
+
+    function showQuestion(state) {
+        questionElement.textContent = state.question;
+        questionNumber.textContent = `Question ${state.question_number} of ${state.questions_per_round}`;
+        answerTextarea.value = '';
+        form.hidden = false;
+        feedbackCard.hidden = true;
+        window.speechUtils && window.speechUtils.speakQuestion();
+    }
+
+    function showFeedback(text) {
+        form.hidden = true;
+        feedbackCard.hidden = false;
+        feedbackContent.textContent = text;
+    }
+
+    const handlers = {
+        state(state) {
+            if (state.question && state.question !== questionElement.textContent) {
+                showQuestion(state);
+            }
+            if (pendingAnswer && state.question === pendingAnswer.question) {
+                // Resending returns the feedback if it was recorded before the drop
+                send(pendingAnswer);
+            } else if (state.feedback) {
+                showFeedback(state.feedback);
+                nextButton.disabled = false;
+            }
+        },
+        question(state) {
+            showQuestion(state);
+        },
+        feedback(message) {
+            feedbackContent.appendChild(document.createTextNode(message.token));
+        },
+        feedback_done(message) {
+            pendingAnswer = null;
+            showFeedback(message.feedback);
+            nextButton.textContent = message.round_complete ? 'Start New Round' : 'Next Question';
+            nextButton.disabled = false;
+            window.speechUtils && window.speechUtils.speakFeedback();
+        },
+        summary() {
+            location.href = '/summary';
+        },
+        error(message) {
+            pendingAnswer = null;
+            feedbackContent.textContent = message.error;
+            feedbackCard.hidden = false;
+            form.hidden = false;
+            nextButton.disabled = false;
+        }
+    };
+
+    function connect() {
+        socket = new WebSocket(url);
+
+        socket.onopen = () => {
+            retryDelay = 500;
+        };
+
+        socket.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            const handler = handlers[message.type];
+            if (handler) handler(message);
+        };
+
+        socket.onclose = (event) => {
+            socket = null;
+            if (FINAL_CLOSE_CODES.includes(event.code)) {
+                return;
+            }
+            // The server checkpoints every turn, so a new connection resumes it
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 10000);
+        };
+    }
+
+    // Answers go over the socket; the form still posts if it is down
+    form.addEventListener('submit', (event) => {
+        const message = {type: 'answer', answer: answerTextarea.value, question: questionElement.textContent};
+        if (!send(message)) {
+            return;
+        }
+        event.preventDefault();
+        pendingAnswer = message;
+        showFeedback('');
+        nextButton.disabled = true;
+    });
+
+    // Same for moving on or ending: the form posts to /continue as a fallback
+    continueForm.addEventListener('submit', (event) => {
+        const action = event.submitter ? event.submitter.value : 'continue';
+        if (!send({type: action === 'end' ? 'end' : 'next'})) {
+            return;
+        }
+        event.preventDefault();
+        nextButton.disabled = true;
+    });
+
+    connect();
+});
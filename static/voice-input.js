@@ -7,6 +7,12 @@ document.addEventListener('DOMContentLoaded', () => {
     const statusElement = document.getElementById('recordingStatus');
     const answerTextarea = document.getElementById('answer');
     
+    // Use the server's recognizer when it has one
+    if (startButton.dataset.serverSpeech === 'true' && navigator.mediaDevices && window.AudioContext) {
+        setupServerRecognition();
+        return;
+    }
+    
     // Check if browser supports SpeechRecognition
     const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
     
@@ -71,4 +77,108 @@ document.addEventListener('DOMContentLoaded', () => {
         statusElement.textContent = 'Ready';
         statusElement.classList.remove('text-danger');
     };
+    
+    // Streams microphone audio to /api/v1/speech/ws and shows partial
+    // transcripts as they come back
+    function setupServerRecognition() {
+        let socket = null;
+        let audioContext = null;
+        let microphone = null;
+        let processor = null;
+        let finalTranscript = '';
+        
+        function showTranscript(transcript) {
+            answerTextarea.value = [finalTranscript.trim(), transcript].filter(Boolean).join(' ');
+        }
+        
+        function startCapture() {
+            const source = audioContext.createMediaStreamSource(microphone);
+            processor = audioContext.createScriptProcessor(4096, 1, 1);
+            processor.onaudioprocess = (event) => {
+                // 16-bit PCM at the context's sample rate, which the URL passes on
+                // to the recognizer as ?sample_rate=
+                const samples = event.inputBuffer.getChannelData(0);
+                const pcm = new Int16Array(samples.length);
+                for (let i = 0; i < samples.length; i++) {
+                    const sample = Math.max(-1, Math.min(1, samples[i]));
+                    pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7fff;
+                }
+                if (socket && socket.readyState === WebSocket.OPEN) {
+                    socket.send(pcm.buffer);
+                }
+            };
+            source.connect(processor);
+            processor.connect(audioContext.destination);
+        }
+        
+        function stopCapture() {
+            if (processor) {
+                processor.disconnect();
+                processor = null;
+            }
+            if (microphone) {
+                microphone.getTracks().forEach(track => track.stop());
+                microphone = null;
+            }
+            if (audioContext) {
+                audioContext.close();
+                audioContext = null;
+            }
+        }
+        
+        startButton.addEventListener('click', async () => {
+            finalTranscript = answerTextarea.value;
+            startButton.disabled = true;
+            
+            try {
+                microphone = await navigator.mediaDevices.getUserMedia({audio: {channelCount: 1}});
+            } catch (error) {
+                statusElement.textContent = `Error: ${error.message}`;
+                startButton.disabled = false;
+                return;
+            }
+            
+            audioContext = new AudioContext();
+            const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+            socket = new WebSocket(`${protocol}://${location.host}/api/v1/speech/ws?sample_rate=${audioContext.sampleRate}`);
+            
+            socket.onmessage = (event) => {
+                const message = JSON.parse(event.data);
+                if (message.type === 'ready') {
+                    startCapture();
+                    stopButton.disabled = false;
+                    statusElement.textContent = 'Recording...';
+                    statusElement.classList.add('text-danger');
+                } else if (message.type === 'partial' || message.type === 'final') {
+                    showTranscript(message.transcript);
+                } else if (message.type === 'done') {
+                    showTranscript(message.transcript);
+                } else if (message.type === 'error') {
+                    statusElement.textContent = `Error: ${message.error}`;
+                }
+            };
+            
+            socket.onclose = (event) => {
+                stopCapture();
+                socket = null;
+                startButton.disabled = false;
+                stopButton.disabled = true;
+                statusElement.classList.remove('text-danger');
+                if (event.code === 1013) {
+                    statusElement.textContent = 'Speech recognition is busy, please type your answer or try again';
+                } else if (event.code === 1000) {
+                    statusElement.textContent = 'Ready';
+                }
+            };
+        });
+        
+        stopButton.addEventListener('click', () => {
+            stopCapture();
+            stopButton.disabled = true;
+            statusElement.textContent = 'Transcribing...';
+            if (socket && socket.readyState === WebSocket.OPEN) {
+                socket.send(JSON.stringify({type: 'end'}));
+            }
+        });
+    }
 });
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from typing import Any, Dict, List
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+from ttl_cache import AsyncTTLCache
+from redis_session_manager import SESSION_TTL
+
+# Shared Jinja2 environment for the HTML routes. Compiled templates are kept
+# in memory and their bytecode on disk, so a fresh worker skips parsing and
+# compiling; with auto reload off, rendering does not even stat the files.
+# Summary cards are rendered once per completed question and cached, since
+# finished questions never change.
+
+TEMPLATE_DIR = "templates"
+TEMPLATE_CACHE_DIR = os.getenv("Template_Cache_Dir", os.path.join(tempfile.gettempdir(), "interviewmate-jinja"))
+# Turn on while editing templates so changes show up without a restart
+TEMPLATE_AUTO_RELOAD = os.getenv("Template_Auto_Reload", "false").lower() == "true"
+SUMMARY_CARD_CACHE_SIZE = int(os.getenv("Summary_Card_Cache_Size", "2048"))
+
+def _bytecode_cache():
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    except OSError:
+        # Read-only filesystem - templates are still cached in memory
+        return None
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    bytecode_cache=_bytecode_cache(),
+)
+templates = Jinja2Templates(env=environment)
+
+# Rendered cards by (session_id, position, content hash). The hash keeps a
+# card from being reused when a new interview in the same session reaches
+# the same position with different content.
+summary_cards = AsyncTTLCache(max_size=SUMMARY_CARD_CACHE_SIZE, ttl=SESSION_TTL)
+
+def render_summary_cards(session_id: str, completed_questions: List[Dict[str, Any]]) -> List[Markup]:
+    """Accordion items for the summary page, rendering only cards not seen before"""
+    template = None
+    cards = []
+    for index, item in enumerate(completed_questions, start=1):
+        key = (session_id, index, hash((item.get("question"), item.get("answer"), item.get("feedback"))))
+        card = summary_cards.get(key)
+        if card is None:
+            template = template or environment.get_template("summary_card.html")
+            card = Markup(template.render(item=item, index=index))
+            summary_cards.set(key, card)
+        cards.append(card)
+    return cards
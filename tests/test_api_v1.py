@@ -0,0 +1,71 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import api_v1
+import interview_controller
+import question_bank
+import session_manager
+
+class FakeInterviewMate:
+    """Stands in for the LLM: numbered questions, feedback echoing the answer"""
+
+    async def agenerate_questions(self, job_topic, question_number, count, previous_questions):
+        return [f"{job_topic} question {question_number + offset}" for offset in range(count)]
+
+    async def agenerate_question(self, job_topic, question_number, previous_questions):
+        return f"{job_topic} question {question_number}"
+
+    async def agenerate_feedback(self, job_topic, question, answer):
+        return f"Feedback on: {answer}"
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(session_manager, "backend", session_manager.MemorySessionBackend())
+    monkeypatch.setattr(question_bank, "QUESTION_BANK_ENABLED", False)
+
+    async def get_interview_mate(api_key):
+        return FakeInterviewMate()
+
+    monkeypatch.setattr(interview_controller, "get_interview_mate", get_interview_mate)
+
+    app = FastAPI()
+    app.include_router(api_v1.router)
+    with TestClient(app) as client:
+        token = client.post("/api/v1/sessions", json={"api_key": "sk-test"}).json()["token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client
+
+def start_interview(client):
+    response = client.post("/api/v1/interview", json={"job_topic": "Python", "questions_per_round": 3})
+    assert response.status_code == 200
+    return response.json()
+
+def test_answer_returns_feedback_and_next_question(client):
+    first = start_interview(client)["question"]
+
+    response = client.post("/api/v1/interview/answer", json={"answer": "Use a generator", "question": first})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answered_question"] == first
+    assert body["feedback"] == "Feedback on: Use a generator"
+    assert body["question"] and body["question"] != first
+    assert body["question_number"] == 2
+
+def test_retried_answer_after_advancing_is_rejected(client):
+    first = start_interview(client)["question"]
+    answer = {"answer": "Use a generator", "question": first}
+    assert client.post("/api/v1/interview/answer", json=answer).status_code == 200
+
+    retry = client.post("/api/v1/interview/answer", json=answer)
+
+    assert retry.status_code == 409
+    assert client.get("/api/v1/interview").json()["question_number"] == 2
+
+def test_answer_requires_the_question(client):
+    start_interview(client)
+
+    response = client.post("/api/v1/interview/answer", json={"answer": "Use a generator"})
+
+    assert response.status_code == 422
@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+import redis_session_manager as rsm
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(rsm, "redis_client", client)
+    monkeypatch.setattr(rsm, "SESSION_STORE_MODE", "hash")
+    rsm.hash_layout_sessions.clear()
+    return client
+
+def test_write_to_legacy_json_session_migrates_once(client):
+    """A write to a session stored as one JSON string migrates it, and its appends land exactly once"""
+    session_id = "legacy"
+    legacy = {"api_key": "sk-test", "question_number": 2, "completed_questions": [{"question": "Q1"}]}
+
+    async def scenario():
+        await client.set(rsm._session_key(session_id), json.dumps(legacy))
+        assert await rsm.update_session(
+            session_id, question_number=3, appends={"completed_questions": [{"question": "Q2"}]}
+        )
+        return await rsm.get_session(session_id), await client.type(rsm._session_key(session_id))
+
+    session, key_type = asyncio.run(scenario())
+    assert key_type == "hash"
+    assert session["api_key"] == "sk-test"
+    assert session["question_number"] == 3
+    assert session["completed_questions"] == [{"question": "Q1"}, {"question": "Q2"}]
+
+def test_wrong_type_detected_in_pipeline_errors():
+    error = rsm.ResponseError(
+        "Command # 1 (HSET session:x session_id \"x\") of pipeline caused error: "
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+    assert rsm._is_wrong_type(error)
@@ -0,0 +1,54 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import redis_session_manager as rsm
+import session_manager
+
+class SlowBackend(session_manager.MemorySessionBackend):
+    """Remote store whose writes take a while, to cancel one mid-flight"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = asyncio.Event()
+        self.writes = 0
+
+    async def update_session(self, session_id, appends=None, pops=None, **kwargs):
+        self.started.set()
+        await asyncio.sleep(0.05)
+        self.writes += 1
+        return await super().update_session(session_id, appends=appends, pops=pops, **kwargs)
+
+@pytest.fixture(autouse=True)
+def redis_client(monkeypatch):
+    monkeypatch.setattr(rsm, "redis_client", fakeredis.FakeAsyncRedis(decode_responses=True))
+
+def test_close_during_write_behind_keeps_every_write():
+    async def scenario():
+        remote = SlowBackend()
+        tiered = session_manager.TieredSessionBackend(remote, delay=0)
+        await tiered.update_session("s", appends={"completed_questions": ["q1"]})
+        await tiered.update_session("s", pops={"completed_questions": 1})
+        await remote.started.wait()
+
+        await tiered.close()
+        return remote, tiered
+
+    remote, tiered = asyncio.run(scenario())
+    assert remote.writes == 2
+    assert not tiered._pending
+    assert asyncio.run(remote.get_session("s"))["completed_questions"] == []
+
+def test_delete_waits_for_write_in_flight():
+    async def scenario():
+        remote = SlowBackend()
+        tiered = session_manager.TieredSessionBackend(remote, delay=0)
+        await tiered.update_session("s", question_number=2)
+        await remote.started.wait()
+
+        await tiered.delete_session("s")
+        await tiered.close()
+        return await remote.get_session("s")
+
+    assert asyncio.run(scenario()) is None
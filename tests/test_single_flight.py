@@ -0,0 +1,54 @@
+import asyncio
+import itertools
+
+import fakeredis
+import pytest
+
+import interview_controller
+import redis_session_manager as rsm
+import single_flight
+from request_session import RequestSession
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(rsm, "redis_client", client)
+    monkeypatch.setattr(single_flight, "_release_script", None)
+    return client
+
+def test_release_drops_the_result_after_a_grace_period(client):
+    async def scenario():
+        result = await single_flight.run_once("s:question:0:0", lambda: asyncio.sleep(0, "Q1"))
+        ttl = await client.pttl(single_flight._result_key("s:question:0:0"))
+        lock = await client.get(single_flight._lock_key("s:question:0:0"))
+        return result, ttl, lock
+
+    result, ttl, lock = asyncio.run(scenario())
+    assert result == ("Q1", False)
+    assert 0 < ttl <= single_flight.FLIGHT_RESULT_GRACE_MS
+    assert lock is None
+
+def test_next_question_is_not_served_from_a_stale_flight(client, monkeypatch):
+    async def failed_release(self):
+        pass
+
+    # The lock and result of every flight stay behind, as when the release fails
+    monkeypatch.setattr(single_flight.Flight, "_release", failed_release)
+    questions = itertools.count(1)
+
+    async def produce_question(session):
+        return f"Q{next(questions)}"
+
+    monkeypatch.setattr(interview_controller, "_produce_question", produce_question)
+
+    async def scenario():
+        session = RequestSession("s", {
+            "api_key": "sk-test", "job_topic": "Python", "question_number": 1,
+            "questions_per_round": 3, "bank_offset": 7, "previous_questions": [],
+        })
+        first = await interview_controller.generate_question(session)
+        await interview_controller.continue_interview(session)
+        second = await interview_controller.generate_question(session)
+        return first, second
+
+    assert asyncio.run(scenario()) == ("Q1", "Q2")
@@ -0,0 +1,25 @@
+import templating
+
+def test_summary_cards_render_once_and_follow_content(monkeypatch):
+    rendered = []
+    template = templating.environment.get_template("summary_card.html")
+    original = template.render
+
+    def render(*args, **kwargs):
+        rendered.append(kwargs["index"])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(template, "render", render)
+    monkeypatch.setattr(templating.environment, "get_template", lambda name: template)
+    monkeypatch.setattr(templating, "summary_cards", templating.AsyncTTLCache(max_size=4, ttl=60))
+    items = [{"question": f"Q{number}", "answer": "A", "feedback": "F"} for number in range(3)]
+
+    first = templating.render_summary_cards("s", items)
+    again = templating.render_summary_cards("s", items)
+    items[1] = {**items[1], "feedback": "Changed"}
+    changed = templating.render_summary_cards("s", items)
+
+    assert again == first
+    assert "Changed" in changed[1]
+    assert rendered == [1, 2, 3, 2]
+    assert templating.summary_cards.evictions == 0
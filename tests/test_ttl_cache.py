@@ -0,0 +1,29 @@
+import time
+
+from ttl_cache import AsyncTTLCache
+
+def test_replacing_a_value_is_not_an_eviction():
+    evicted = []
+    cache = AsyncTTLCache(max_size=2, ttl=60, on_evict=lambda key, value: evicted.append(key))
+
+    for value in range(1000):
+        cache.set("a", value)
+
+    assert cache.get("a") == 999
+    assert cache.evictions == 0
+    assert evicted == []
+
+def test_set_evicts_expired_then_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = AsyncTTLCache(max_size=2, ttl=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache and "a" in cache
+
+    now[0] += 11
+    cache.set("d", 4)
+    assert len(cache) == 1 and cache.get("d") == 4
@@ -0,0 +1,323 @@
+import asyncio
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import os
+import struct
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import metrics
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Server-side speech recognition with Vosk, an offline engine that reports
+# partial results while audio is still coming in. Recognition is CPU bound,
+# so it runs in a fixed set of worker processes that each load the model
+# once. A recognizer keeps state across chunks, so every stream is pinned to
+# one worker; streams are spread over the workers by load and the total is
+# capped, so a burst of voice answers is turned away instead of queueing
+# behind each other. The event loop only ever waits on a pipe from a thread.
+#
+# Audio is 16-bit little-endian mono PCM at the stream's sample rate.
+
+# Directory of an unpacked Vosk model, e.g. vosk-model-small-en-us-0.15
+SPEECH_MODEL_PATH = os.getenv("Speech_Model_Path", "")
+SPEECH_WORKERS = int(os.getenv("Speech_Workers", str(max(1, (os.cpu_count() or 2) - 1))))
+SPEECH_MAX_STREAMS = int(os.getenv("Speech_Max_Streams", str(SPEECH_WORKERS * 4)))
+# Longest answer accepted, in seconds of audio
+SPEECH_MAX_SECONDS = float(os.getenv("Speech_Max_Seconds", "300"))
+
+SAMPLE_WIDTH = 2  # bytes per sample
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+
+class TranscriptionError(Exception):
+    """The recognizer failed or the audio could not be used"""
+
+class TranscriptionUnavailable(TranscriptionError):
+    """No model is configured, or every stream slot is taken"""
+
+def _worker_main(conn, model_path: str) -> None:
+    """Worker process: one model, a recognizer per open stream"""
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+
+    SetLogLevel(-1)
+    model = Model(model_path)
+    recognizers: Dict[int, Any] = {}
+    conn.send((True, "ready"))
+
+    while True:
+        try:
+            op, stream_id, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            if op == "open":
+                recognizers[stream_id] = KaldiRecognizer(model, payload)
+                result = None
+            elif op == "feed":
+                recognizer = recognizers[stream_id]
+                if recognizer.AcceptWaveform(payload):
+                    result = ("final", json.loads(recognizer.Result()).get("text", ""))
+                else:
+                    result = ("partial", json.loads(recognizer.PartialResult()).get("partial", ""))
+            elif op == "finish":
+                result = ("final", json.loads(recognizers.pop(stream_id).FinalResult()).get("text", ""))
+            elif op == "close":
+                recognizers.pop(stream_id, None)
+                result = None
+            else:
+                return
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+def parse_wav_header(data: bytes) -> Optional[Tuple[int, int]]:
+    """Sample rate and offset of the samples in a WAV file, or None until more bytes arrive
+
+    Only 16-bit mono PCM is accepted.
+    """
+    if len(data) < 12:
+        return None
+    riff, _, wave = struct.unpack("<4sI4s", data[:12])
+    if riff != b"RIFF" or wave != b"WAVE":
+        raise TranscriptionError("Audio must be a WAV file")
+
+    offset = 12
+    sample_rate = None
+    while len(data) >= offset + 8:
+        chunk_id, size = struct.unpack("<4sI", data[offset:offset + 8])
+        body = offset + 8
+        if chunk_id == b"data":
+            if sample_rate is None:
+                raise TranscriptionError("WAV file has no format chunk")
+            return sample_rate, body
+        if chunk_id == b"fmt ":
+            if len(data) < body + 16:
+                return None
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", data[body:body + 16])
+            if audio_format != 1 or channels != 1 or bits != 16:
+                raise TranscriptionError("Audio must be 16-bit mono PCM")
+        # Chunks are padded to an even size
+        offset = body + size + (size & 1)
+
+    if offset > 65536:
+        raise TranscriptionError("WAV header is too large")
+    return None
+
+class _Worker:
+    """One recognizer process and the pipe to it"""
+
+    def __init__(self, index: int, model_path: str):
+        self.index = index
+        self.model_path = model_path
+        self.streams = 0
+        self.process = None
+        self.conn = None
+        # Requests on the pipe go one at a time
+        self.lock = asyncio.Lock()
+
+    def start(self) -> None:
+        """Spawn the process and wait until its model is loaded (blocking)"""
+        if self.process is not None:
+            return
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, self.model_path),
+            name=f"speech-worker-{self.index}", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        try:
+            self._receive()
+        except EOFError:
+            self.process.join()
+            self.process = None
+            raise TranscriptionError(f"Speech worker could not load the model from {self.model_path}")
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        try:
+            self.conn.send(("stop", 0, None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+        self.process = None
+
+    def _receive(self) -> Any:
+        ok, result = self.conn.recv()
+        if not ok:
+            raise TranscriptionError(result)
+        return result
+
+    def _round_trip(self, request: Tuple[str, int, Any]) -> Any:
+        try:
+            self.conn.send(request)
+            return self._receive()
+        except (EOFError, OSError) as e:
+            # The process died; its streams are lost, later ones get a fresh one
+            logger.error("Speech worker %d failed: %s: %s", self.index, type(e).__name__, e)
+            self.stop()
+            self.start()
+            raise TranscriptionError("The speech worker restarted, please record again") from e
+
+    def _release(self, round_trip: asyncio.Future) -> None:
+        self.lock.release()
+        if not round_trip.cancelled():
+            # Mark the error as seen when the caller is already gone
+            round_trip.exception()
+
+    async def call(self, op: str, stream_id: int, payload: Any = None) -> Any:
+        await self.lock.acquire()
+        round_trip = asyncio.ensure_future(asyncio.to_thread(self._round_trip, (op, stream_id, payload)))
+        # The pipe stays locked until the reply is read, even if the caller is
+        # cancelled meanwhile - otherwise the next request would get this reply
+        round_trip.add_done_callback(self._release)
+        return await asyncio.shield(round_trip)
+
+class TranscriptionStream:
+    """One answer's audio, fed in chunks to its pinned worker"""
+
+    def __init__(self, worker: _Worker, stream_id: int, sample_rate: int):
+        self.worker = worker
+        self.stream_id = stream_id
+        self.sample_rate = sample_rate
+        self.segments: List[str] = []
+        self.partial = ""
+        self.audio_bytes = 0
+        self._remainder = b""
+
+    @property
+    def transcript(self) -> str:
+        """Finished segments plus the segment still being recognized"""
+        return " ".join(part for part in self.segments + [self.partial] if part)
+
+    async def _call(self, op: str, payload: Any = None) -> Any:
+        started = time.perf_counter()
+        try:
+            return await self.worker.call(op, self.stream_id, payload)
+        finally:
+            metrics.speech_chunk_seconds.observe(time.perf_counter() - started, op)
+
+    async def feed(self, pcm: bytes) -> Dict[str, Any]:
+        """Recognize a chunk; returns the partial or newly finished segment"""
+        self.audio_bytes += len(pcm)
+        if self.audio_bytes > SPEECH_MAX_SECONDS * self.sample_rate * SAMPLE_WIDTH:
+            raise TranscriptionError(f"Answers are limited to {SPEECH_MAX_SECONDS:.0f} seconds of audio")
+
+        # Uploads arrive in arbitrary chunks; keep a split sample for the next one
+        pcm = self._remainder + pcm
+        split = len(pcm) - len(pcm) % SAMPLE_WIDTH
+        pcm, self._remainder = pcm[:split], pcm[split:]
+
+        kind, text = await self._call("feed", pcm)
+        if kind == "final":
+            self.partial = ""
+            if text:
+                self.segments.append(text)
+        else:
+            self.partial = text
+        return {"type": kind, "text": text, "transcript": self.transcript}
+
+    async def finish(self) -> str:
+        """Flush the recognizer and return the whole transcript"""
+        _, text = await self._call("finish")
+        self.partial = ""
+        if text:
+            self.segments.append(text)
+        return self.transcript
+
+class TranscriberPool:
+    """Bounded set of recognizer processes shared by every stream in this worker"""
+
+    def __init__(self, model_path: str, workers: int, max_streams: int):
+        self.model_path = model_path
+        self.max_streams = max_streams
+        self.workers = [_Worker(index, model_path) for index in range(workers)]
+        self.active = 0
+        self._started: Optional[asyncio.Task] = None
+        self._ids = itertools.count(1)
+        self.metrics = {"streams": 0, "rejected": 0, "errors": 0}
+        # The engine itself is only imported in the worker processes
+        self.enabled = bool(model_path) and importlib.util.find_spec("vosk") is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "active": self.active, "max_streams": self.max_streams, "workers": len(self.workers)}
+
+    async def start(self) -> None:
+        """Start every worker process once; loading the models takes a few seconds"""
+        if not self.enabled:
+            raise TranscriptionUnavailable("Server-side transcription is not configured")
+        if self._started is None:
+            self._started = asyncio.ensure_future(
+                asyncio.gather(*(asyncio.to_thread(worker.start) for worker in self.workers))
+            )
+            logger.info("Starting %d speech workers with model %s", len(self.workers), self.model_path)
+        try:
+            await asyncio.shield(self._started)
+        except Exception:
+            # Allow the next stream to retry, e.g. after the model was fixed
+            self._started = None
+            raise
+
+    async def close(self) -> None:
+        if self._started is None:
+            return
+        self._started = None
+        await asyncio.gather(*(asyncio.to_thread(worker.stop) for worker in self.workers), return_exceptions=True)
+
+    @asynccontextmanager
+    async def stream(self, sample_rate: int) -> AsyncIterator[TranscriptionStream]:
+        """Open a recognizer for one answer on the least busy worker
+
+        Raises TranscriptionUnavailable right away when all slots are taken,
+        so clients can fall back to browser speech recognition.
+        """
+        if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+            raise TranscriptionError(f"Unsupported sample rate {sample_rate}")
+        if self.active >= self.max_streams:
+            self.metrics["rejected"] += 1
+            raise TranscriptionUnavailable("All speech recognizers are busy")
+
+        self.active += 1
+        worker = min(self.workers, key=lambda candidate: candidate.streams)
+        worker.streams += 1
+        transcription = TranscriptionStream(worker, next(self._ids), sample_rate)
+        try:
+            await self.start()
+            await worker.call("open", transcription.stream_id, sample_rate)
+            self.metrics["streams"] += 1
+            yield transcription
+        except TranscriptionError:
+            self.metrics["errors"] += 1
+            raise
+        finally:
+            self.active -= 1
+            worker.streams -= 1
+            if worker.process is not None:
+                try:
+                    await worker.call("close", transcription.stream_id)
+                except Exception:
+                    pass
+
+pool = TranscriberPool(SPEECH_MODEL_PATH, SPEECH_WORKERS, SPEECH_MAX_STREAMS)
+
+async def start_transcriber_pool() -> None:
+    """Load the speech models at startup when transcription is configured"""
+    if not pool.enabled:
+        return
+    try:
+        await pool.start()
+    except Exception as e:
+        logger.error("Failed to start speech workers: %s: %s", type(e).__name__, e)
+
+async def close_transcriber_pool() -> None:
+    await pool.close()
@@ -0,0 +1,131 @@
+import asyncio
+import inspect
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class AsyncTTLCache:
+    """Bounded LRU cache with a per-entry TTL and single-flight construction
+
+    ``on_evict(key, value)`` is called for every entry that leaves the cache,
+    whether it expired, was pushed out by the size limit or was cleared;
+    ``drain`` hands the values back to the caller instead.
+    """
+
+    def __init__(self, max_size: int, ttl: float, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        # get_or_create callers that waited on a build already in progress
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    def _evict(self, key: Hashable) -> None:
+        value, _ = self._entries.pop(key)
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def _lookup(self, key: Hashable) -> Optional[Any]:
+        """Return a live entry and mark it recently used, dropping it if expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value; replacing an existing one is not an eviction"""
+        now = time.monotonic()
+        self._entries[key] = (value, now + self.ttl)
+        self._entries.move_to_end(key)
+
+        # Drop expired entries from the least recently used end, then whatever
+        # is over the size limit. Only the head is looked at, so a write costs
+        # O(1) amortized; an expired entry behind a live one goes on lookup.
+        while self._entries:
+            oldest_key, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_size:
+                break
+            self._evict(oldest_key)
+
+    def pop(self, key: Hashable) -> None:
+        """Remove an entry, running the eviction callback"""
+        if key in self._entries:
+            self._evict(key)
+
+    def clear(self) -> None:
+        for key in list(self._entries):
+            self._evict(key)
+
+    def drain(self) -> list:
+        """Remove every entry without eviction callbacks and return the values"""
+        values = [value for value, _ in self._entries.values()]
+        self._entries.clear()
+        return values
+
+    async def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value, building it once even under concurrent callers"""
+        value = self._lookup(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Another coroutine is already building this entry - share its result.
+            # Not a hit: the caller still waits for the build
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = factory()
+            if inspect.isawaitable(value):
+                value = await value
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }